@@ -1,183 +1,242 @@
 import streamlit as st
 import pandas as pd
-import os
 import datetime
-import plotly.express as px
-import requests
-import json
-from io import StringIO
 import calendar
-from datetime import timedelta
+import html
+
+from workout_core import (
+    CHART_MAX_POINTS,
+    EXPORT_FORMATS,
+    PROFILE_LOG_FILE,
+    PROFILER,
+    WORKOUTS,
+    StorageError,
+    add_workout_sets,
+    cached_render,
+    check_storage,
+    downsample_progress,
+    empty_data,
+    get_daily_index,
+    get_exercise_dashboard,
+    get_gist_credentials,
+    get_last_session_index,
+    get_progress_index,
+    gist_sync_worker,
+    iter_export,
+    load_data,
+    read_exercise_sets,
+    storage_backend,
+)
 
 # Настройка страницы
 st.set_page_config(page_title="Трекер тренировок", layout="wide")
 
-# Определение тренировок и упражнений
-WORKOUTS = {
-    "Тренировка A": ["Жим лежа", "Приседания", "Тяга в наклоне", "Жим плечами", "Сгибание рук", "Разгибание трицепса"],
-    "Тренировка B": ["Жим ногами", "Становая тяга", "Подтягивания", "Отжимания на брусьях", "Скручивания", "Икроножные"],
-    "Тренировка C": ["Наклонный жим", "Выпады", "Тяга верхнего блока", "Разведение рук", "Молотки", "Пресс"],
-    "Тренировка D": ["Гакк-приседания", "Румынская тяга", "Гребля", "Подъемы в стороны", "Бицепс на скамье", "Пуловер"]
+# Количество тренировок на одной странице истории
+HISTORY_PAGE_SIZE = 20
+# Подходов на упражнение в таблице ввода, если в прошлый раз было меньше
+ENTRY_GRID_SETS = 3
+
+# Цвета дней календаря по первой тренировке дня
+WORKOUT_COLORS = {
+    "Тренировка A": "#ff9999",  # Красный
+    "Тренировка B": "#99ff99",  # Зеленый
+    "Тренировка C": "#9999ff",  # Синий
 }
+DEFAULT_WORKOUT_COLOR = "#ffff99"  # Желтый
+WEEKDAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+# Размер клетки тепловой карты года в пикселях и цвета от дня без тренировки
+# до самого большого тоннажа
+HEATMAP_CELL = 14
+HEATMAP_COLORS = ["#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127"]
 
-DATA_FILE = 'workout_data.csv'
+def get_completed_sets(date, workout, exercise):
+    """Собрать из состояния формы выполненные подходы упражнения"""
+    completed = []
+    sets = st.session_state.get(f"sets_{exercise}", 0)
+    for set_num in range(1, sets + 1):
+        # Проверяем статус подхода
+        if st.session_state.get(f"{exercise}_status_{set_num}", False):
+            # Получаем значения из соответствующих полей
+            reps = st.session_state.get(f"{exercise}_reps_{set_num}")
+            weight = st.session_state.get(f"{exercise}_weight_{set_num}")
+            if reps is None or weight is None:
+                continue
+            completed.append((str(date), workout, exercise, set_num, reps, weight))
+    return completed
 
-# Функции для работы с данными
-def load_data():
-    gist_id = os.environ.get('GIST_ID')
-    github_token = os.environ.get('GITHUB_TOKEN')
-    
-    if not gist_id or not github_token:
-        if os.path.exists(DATA_FILE):
-            return pd.read_csv(DATA_FILE)
-        else:
-            return pd.DataFrame(columns=['Дата', 'Тренировка', 'Упражнение', 'Подход', 'Повторения', 'Вес'])
-    
-    headers = {
-        'Authorization': f'token {github_token}',
-        'Accept': 'application/vnd.github.v3+json'
-    }
-    
-    try:
-        response = requests.get(
-            f'https://api.github.com/gists/{gist_id}',
-            headers=headers
-        )
-        
-        if response.status_code == 200:
-            gist_data = response.json()
-            if 'workout_data.csv' in gist_data['files']:
-                content = gist_data['files']['workout_data.csv']['content']
-                return pd.read_csv(StringIO(content))
-        
-        # Если что-то пошло не так, возвращаем пустой DataFrame
-        return pd.DataFrame(columns=['Дата', 'Тренировка', 'Упражнение', 'Подход', 'Повторения', 'Вес'])
-    
-    except Exception as e:
-        st.error(f"Ошибка при загрузке данных: {e}")
-        return pd.DataFrame(columns=['Дата', 'Тренировка', 'Упражнение', 'Подход', 'Повторения', 'Вес'])
+def build_entry_grid(last_sessions, workout):
+    """Таблица ввода тренировки: строка на подход, значения из предыдущей тренировки"""
+    rows = []
+    for exercise in WORKOUTS[workout]:
+        previous = last_sessions.previous(workout, exercise)
+        previous_sets = {}
+        if previous is not None:
+            previous_sets = {
+                int(set_num): (int(reps), float(weight))
+                for set_num, reps, weight in zip(previous['Подход'], previous['Повторения'], previous['Вес'])
+            }
+        # Подходов столько же, сколько в прошлый раз, но не меньше ENTRY_GRID_SETS
+        for set_num in range(1, max(ENTRY_GRID_SETS, *previous_sets, 0) + 1):
+            reps, weight = previous_sets.get(set_num, (10, 20.0))
+            rows.append({'Упражнение': exercise, 'Подход': set_num, 'Выполнен': False,
+                         'Повторения': reps, 'Вес': weight})
+    return pd.DataFrame(rows)
 
-def save_data(df):
-    # Сначала сохраняем локально как резервную копию
-    df.to_csv(DATA_FILE, index=False)
-    
-    # Затем пытаемся сохранить в GitHub Gist
-    save_data_to_gist(df)
+def get_completed_grid_sets(date, workout, grid):
+    """Выполненные подходы из таблицы ввода"""
+    done = grid[grid['Выполнен']].dropna(subset=['Повторения', 'Вес'])
+    return [
+        (str(date), workout, exercise, int(set_num), int(reps), float(weight))
+        for exercise, set_num, reps, weight in zip(done['Упражнение'], done['Подход'], done['Повторения'], done['Вес'])
+    ]
 
-def save_data_to_gist(df):
-    gist_id = os.environ.get('GIST_ID')
-    github_token = os.environ.get('GITHUB_TOKEN')
-    
-    if not gist_id or not github_token:
-        st.warning("Gist ID или GitHub Token не настроены. Данные сохранены только локально.")
-        return
-    
-    headers = {
-        'Authorization': f'token {github_token}',
-        'Accept': 'application/vnd.github.v3+json'
-    }
-    
-    payload = {
-        "files": {
-            "workout_data.csv": {
-                "content": df.to_csv(index=False)
-            }
-        }
-    }
+def save_completed_sets(completed):
+    """Сохранить подходы и показать предупреждения хранилища.
     
+    Возвращает True, если подходы сохранены.
+    """
     try:
-        response = requests.patch(
-            f'https://api.github.com/gists/{gist_id}',
-            headers=headers,
-            data=json.dumps(payload)
-        )
-        
-        if response.status_code != 200:
-            st.error(f"Ошибка при сохранении данных в Gist: {response.status_code}")
-    except Exception as e:
-        st.error(f"Ошибка при сохранении данных: {e}")
+        add_workout_sets(completed)
+    except StorageError as e:
+        st.error(str(e))
+        return False
+    if storage_backend() == 'csv' and get_gist_credentials() is None:
+        st.warning("Gist ID или GitHub Token не настроены. Данные сохранены только локально.")
+    return True
 
-def add_workout_data(date, workout, exercise, set_num, reps, weight):
-    df = load_data()
-    new_row = pd.DataFrame({
-        'Дата': [date],
-        'Тренировка': [workout],
-        'Упражнение': [exercise],
-        'Подход': [set_num],
-        'Повторения': [reps],
-        'Вес': [weight]
-    })
-    df = pd.concat([df, new_row], ignore_index=True)
-    save_data(df)
-    return df
+def workout_day_frame(start, end):
+    """Все дни периода [start, end] с показателями индекса по дням.
+    
+    Дни без тренировок остаются с нулями, чтобы ячейки строились
+    операциями над колонками, без ветвлений на каждый день.
+    """
+    days = pd.date_range(start, end, freq='D')
+    frame = get_daily_index().reindex(days)
+    frame['Подходы'] = frame['Подходы'].fillna(0).astype(int)
+    frame['Тоннаж'] = frame['Тоннаж'].fillna(0.0)
+    workouts = frame['Тренировки'].astype(object).map(lambda value: value if isinstance(value, list) else [])
+    frame['Тренировки'] = workouts.map(len)
+    frame['Цвет'] = workouts.str[0].map(WORKOUT_COLORS).fillna(DEFAULT_WORKOUT_COLOR)
+    frame['Метка'] = workouts.map(lambda names: " + ".join(html.escape(name[10:].strip()) for name in names))
+    return frame
 
-def get_workout_dates(data):
-    """Получить даты тренировок с информацией о типе тренировки"""
-    if data.empty:
-        return {}
-    
-    # Группируем данные по дате и тренировке
-    workout_dates = data.groupby(['Дата', 'Тренировка']).size().reset_index()
-    workout_dates = workout_dates[['Дата', 'Тренировка']]
-    
-    # Создаем словарь, где ключи - даты, значения - типы тренировок
-    date_workout_dict = {}
-    for _, row in workout_dates.iterrows():
-        date = row['Дата']
-        workout = row['Тренировка']
-        date_workout_dict[date] = workout
-    
-    return date_workout_dict
+def build_calendar_html(year, month):
+    """Календарь месяца одной HTML-таблицей"""
+    month_start = pd.Timestamp(year, month, 1)
+    frame = workout_day_frame(month_start, month_start + pd.offsets.MonthEnd(0))
+    day = frame.index.day.astype(str).to_series(index=frame.index)
+    title = ("Подходов: " + frame['Подходы'].astype(str)
+             + ", тоннаж: " + frame['Тоннаж'].round().astype(int).astype(str) + " кг")
+    workout_cell = ('<td><div title="' + title + '" style="background-color: ' + frame['Цвет']
+                    + '; padding: 5px; border-radius: 5px;">' + day + '<br/>' + frame['Метка'] + '</div></td>')
+    cells = workout_cell.where(frame['Тренировки'] > 0, '<td>' + day + '</td>').tolist()
+    
+    # Пустые ячейки до первого дня месяца (неделя начинается с понедельника)
+    # и после последнего
+    cells = ['<td></td>'] * month_start.weekday() + cells
+    cells += ['<td></td>'] * (-len(cells) % 7)
+    header = ''.join(f'<th>{name}</th>' for name in WEEKDAY_NAMES)
+    rows = ''.join('<tr>' + ''.join(cells[i:i + 7]) + '</tr>' for i in range(0, len(cells), 7))
+    return (f'<table class="workout-calendar"><thead><tr>{header}</tr></thead>'
+            f'<tbody>{rows}</tbody></table>')
 
-def get_previous_workout_data(data, workout, exercise):
-    """Получить данные предыдущей тренировки для указанного упражнения"""
-    if data.empty:
-        return None
-    
-    # Фильтруем данные по тренировке и упражнению
-    filtered_data = data[(data['Тренировка'] == workout) & (data['Упражнение'] == exercise)]
-    
-    if filtered_data.empty:
-        return None
-    
-    # Находим последнюю дату тренировки для этого упражнения
-    last_date = filtered_data['Дата'].max()
-    
-    # Получаем данные этой тренировки
-    last_workout_data = filtered_data[filtered_data['Дата'] == last_date]
-    
-    return last_workout_data
+def build_year_heatmap_html(year):
+    """Тепловая карта года одним SVG: клетка на день, цвет - тоннаж дня"""
+    year_start = pd.Timestamp(year, 1, 1)
+    frame = workout_day_frame(year_start, pd.Timestamp(year, 12, 31))
+    
+    # Столбец - неделя года, строка - день недели
+    column = (frame.index.dayofyear - 1 + year_start.weekday()) // 7
+    row = frame.index.weekday
+    x = (pd.Series(column, index=frame.index) * HEATMAP_CELL + 30).astype(str)
+    y = (pd.Series(row, index=frame.index) * HEATMAP_CELL + 15).astype(str)
+    
+    # Уровень цвета - квантиль тоннажа среди дней с тренировками
+    active = frame['Тренировки'] > 0
+    level = pd.Series(0, index=frame.index)
+    if active.any():
+        quantiles = frame.loc[active, 'Тоннаж'].rank(pct=True)
+        level[active] = (quantiles * (len(HEATMAP_COLORS) - 1)).clip(lower=1).round().astype(int)
+    color = level.map(dict(enumerate(HEATMAP_COLORS)))
+    
+    title = (frame.index.strftime('%Y-%m-%d').to_series(index=frame.index)
+             + ": тренировок " + frame['Тренировки'].astype(str)
+             + ", подходов " + frame['Подходы'].astype(str)
+             + ", тоннаж " + frame['Тоннаж'].round().astype(int).astype(str) + " кг")
+    size = str(HEATMAP_CELL - 2)
+    rects = ('<rect x="' + x + '" y="' + y + '" width="' + size + '" height="' + size
+             + '" rx="2" fill="' + color + '"><title>' + title + '</title></rect>')
+    
+    # Подписи месяцев над первой неделей каждого месяца и дней недели слева
+    month_starts = frame.index[frame.index.day == 1]
+    month_labels = ''.join(
+        f'<text x="{((date.dayofyear - 1 + year_start.weekday()) // 7) * HEATMAP_CELL + 30}" y="10">{date:%b}</text>'
+        for date in month_starts
+    )
+    weekday_labels = ''.join(
+        f'<text x="0" y="{i * HEATMAP_CELL + 15 + HEATMAP_CELL - 4}">{WEEKDAY_NAMES[i]}</text>' for i in (0, 2, 4)
+    )
+    width = (int(column.max()) + 1) * HEATMAP_CELL + 30
+    height = 7 * HEATMAP_CELL + 15
+    return (f'<svg class="workout-heatmap" viewBox="0 0 {width} {height}" width="100%" '
+            f'xmlns="http://www.w3.org/2000/svg" font-size="9">'
+            f'{month_labels}{weekday_labels}{"".join(rects)}</svg>')
 
-def recommend_next_workout(data):
-    """Рекомендовать следующую тренировку на основе истории"""
-    if data.empty:
-        return "Тренировка A"  # Если нет данных, начинаем с тренировки A
-    
-    # Получаем уникальные даты тренировок
-    workout_dates = get_workout_dates(data)
-    
-    if not workout_dates:
-        return "Тренировка A"
-    
-    # Получаем последнюю дату тренировки и ее тип
-    last_date = max(workout_dates.keys())
-    last_workout = workout_dates[last_date]
-    
-    # Определяем следующую тренировку по циклу
-    workout_order = ["Тренировка A", "Тренировка B", "Тренировка C", "Тренировка D"]
-    current_index = workout_order.index(last_workout)
-    next_index = (current_index + 1) % len(workout_order)
-    
-    return workout_order[next_index]
+def build_progress_figures(history, exercise, period):
+    """Графики веса и повторений упражнения за период (None - вся история).
+    
+    Возвращает (график веса, график повторений, (число точек, период укрупнения или None)).
+    """
+    # plotly.express импортируется долго и нужен только для графиков
+    import plotly.express as px
+    
+    chart_data = history
+    if period is not None:
+        chart_data = history.loc[pd.Timestamp(period[0]):pd.Timestamp(period[1])]
+    
+    # В браузер уходит не больше CHART_MAX_POINTS точек на график
+    chart_data, bucket = downsample_progress(chart_data)
+    chart_data = chart_data.reset_index()
+    
+    fig_weight = px.line(chart_data, x='Дата', y='Вес', markers=True,
+                        title=f"Изменение максимального веса для {exercise}")
+    fig_weight.update_layout(xaxis_title="Дата", yaxis_title="Вес (кг)")
+    fig_reps = px.line(chart_data, x='Дата', y='Повторения', markers=True,
+                      title=f"Изменение максимальных повторений для {exercise}")
+    fig_reps.update_layout(xaxis_title="Дата", yaxis_title="Повторения")
+    return fig_weight, fig_reps, (len(chart_data), bucket)
+
+def build_dashboard_figure(series):
+    """Маленькие графики максимального веса, по одному на упражнение"""
+    import plotly.express as px
+    rows = (series['Упражнение'].nunique() + 3) // 4
+    # Строки вместо категорий: иначе plotly строит графики и для упражнений без данных
+    fig = px.line(series.astype({'Упражнение': str}), x='Дата', y='Вес', facet_col='Упражнение', facet_col_wrap=4,
+                  facet_row_spacing=0.04, height=max(rows, 1) * 180)
+    fig.for_each_annotation(lambda annotation: annotation.update(text=annotation.text.split("=")[-1]))
+    # У каждого упражнения свой масштаб веса
+    fig.update_yaxes(matches=None, showticklabels=True, title_text="")
+    fig.update_xaxes(title_text="")
+    return fig
+
+# Замеры этого перезапуска (флажок панели отладки хранится в состоянии сессии)
+PROFILER.start_run(st.session_state.get("profile_panel", False))
 
-# Загрузка данных
-data = load_data()
+# Проверка хранилища. Вся история загружается только на странице истории,
+# остальным страницам хватает индексов
+storage_error = None
+try:
+    check_storage()
+except StorageError as e:
+    storage_error = str(e)
+    st.error(storage_error)
 
 # Заголовок приложения
 st.title("Трекер тренировок в зале")
 
 # Боковая панель для выбора режима
-mode = st.sidebar.radio("Выберите режим", ["Календарь", "Запись тренировки", "История тренировок", "Анализ прогресса"])
+mode = st.sidebar.radio("Выберите режим", ["Календарь", "Запись тренировки", "История тренировок", "Анализ прогресса", "Сводка по упражнениям"], key="mode")
+page_span = PROFILER.span(f"страница: {mode}").begin()
 
 if mode == "Календарь":
     st.header("Календарь тренировок")
@@ -192,63 +251,25 @@ if mode == "Календарь":
                         range(current_date.year - 1, current_date.year + 2), 
                         index=1)
     
-    # Создаем календарь
-    cal = calendar.monthcalendar(year, month)
-    
-    # Получаем данные о тренировках
-    workout_dates = get_workout_dates(data)
-    
-    # Отображаем календарь
+    # Календарь и тепловая карта строятся один раз на версию данных
+    # и выводятся каждый одним элементом
     st.write("### Календарь тренировок")
-    
-    # Названия дней недели
-    days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-    
-    # Создаем таблицу календаря
-    cols = st.columns(7)
-    for i, day in enumerate(days):
-        cols[i].markdown(f"**{day}**")
-    
-    # Заполняем календарь
-    for week in cal:
-        cols = st.columns(7)
-        for i, day in enumerate(week):
-            if day == 0:
-                cols[i].write("")
-            else:
-                date_str = f"{year}-{month:02d}-{day:02d}"
-                
-                # Проверяем, была ли тренировка в этот день
-                if date_str in workout_dates:
-                    workout_type = workout_dates[date_str]
-                    # Определяем цвет в зависимости от типа тренировки
-                    if workout_type == "Тренировка A":
-                        bgcolor = "#ff9999"  # Красный
-                    elif workout_type == "Тренировка B":
-                        bgcolor = "#99ff99"  # Зеленый
-                    elif workout_type == "Тренировка C":
-                        bgcolor = "#9999ff"  # Синий
-                    else:
-                        bgcolor = "#ffff99"  # Желтый
-                        
-                    cols[i].markdown(f"""
-                    <div style="background-color: {bgcolor}; padding: 5px; border-radius: 5px; text-align: center;">
-                        {day}<br/>{workout_type[10:]}
-                    </div>
-                    """, unsafe_allow_html=True)
-                else:
-                    cols[i].write(f"{day}")
+    st.markdown(cached_render("calendar", (year, month), lambda: build_calendar_html(year, month)),
+                unsafe_allow_html=True)
     
     # Легенда
-    st.write("### Легенда")
-    col1, col2, col3, col4 = st.columns(4)
-    col1.markdown('<div style="background-color: #ff9999; padding: 5px; border-radius: 5px; text-align: center;">Тренировка A</div>', unsafe_allow_html=True)
-    col2.markdown('<div style="background-color: #99ff99; padding: 5px; border-radius: 5px; text-align: center;">Тренировка B</div>', unsafe_allow_html=True)
-    col3.markdown('<div style="background-color: #9999ff; padding: 5px; border-radius: 5px; text-align: center;">Тренировка C</div>', unsafe_allow_html=True)
-    col4.markdown('<div style="background-color: #ffff99; padding: 5px; border-radius: 5px; text-align: center;">Тренировка D</div>', unsafe_allow_html=True)
+    legend = ''.join(
+        f'<span style="background-color: {color}; padding: 5px 15px; border-radius: 5px; margin-right: 10px;">{name}</span>'
+        for name, color in [*WORKOUT_COLORS.items(), ("Тренировка D", DEFAULT_WORKOUT_COLOR)]
+    )
+    st.markdown(legend, unsafe_allow_html=True)
+    
+    # Весь год: клетка на день, чем темнее, тем больше тоннаж
+    st.write(f"### {year} год")
+    st.markdown(cached_render("heatmap", (year,), lambda: build_year_heatmap_html(year)), unsafe_allow_html=True)
     
     # Рекомендация следующей тренировки
-    next_workout = recommend_next_workout(data)
+    next_workout = get_last_session_index().recommend_next_workout()
     st.info(f"Рекомендуемая следующая тренировка: **{next_workout}**")
 
 elif mode == "Запись тренировки":
@@ -260,109 +281,142 @@ elif mode == "Запись тренировки":
         date = st.date_input("Дата тренировки", datetime.date.today())
     with col2:
         # Рекомендуем следующую тренировку
-        recommended_workout = recommend_next_workout(data)
+        last_sessions = get_last_session_index()
+        recommended_workout = last_sessions.recommend_next_workout()
         workout = st.selectbox("Выберите программу тренировки", 
                                list(WORKOUTS.keys()),
                                index=list(WORKOUTS.keys()).index(recommended_workout))
     
-    # Создаем таблицу для ввода данных по всем упражнениям
-    st.subheader(f"Упражнения для {workout}")
+    # Таблица отправляет все правки одной формой, то есть одним перезапуском
+    # скрипта. Ввод по подходам перезапускает его на каждое изменение поля
+    entry_mode = st.radio("Способ ввода", ["Таблица", "По подходам"], horizontal=True, key="entry_mode")
+    
+    if entry_mode == "Таблица":
+        st.subheader(f"Упражнения для {workout}")
+        with st.form(f"entry_form_{workout}"):
+            st.caption("Отметьте выполненные подходы и при необходимости поправьте значения "
+                       "предыдущей тренировки. Изменения отправятся кнопкой сохранения.")
+            grid = st.data_editor(
+                build_entry_grid(last_sessions, workout),
+                key=f"entry_grid_{workout}_{date}",
+                hide_index=True,
+                use_container_width=True,
+                disabled=['Упражнение', 'Подход'],
+                column_config={
+                    'Выполнен': st.column_config.CheckboxColumn("Выполнен"),
+                    'Повторения': st.column_config.NumberColumn("Повторения", min_value=1, max_value=100, step=1, required=True),
+                    'Вес': st.column_config.NumberColumn("Вес (кг)", min_value=0.0, max_value=500.0, step=2.5, required=True),
+                },
+            )
+            submitted = st.form_submit_button("Сохранить тренировку", type="primary")
+        
+        if submitted:
+            completed = get_completed_grid_sets(date, workout, grid)
+            if completed:
+                if save_completed_sets(completed):
+                    st.success(f"Сохранено подходов: {len(completed)}")
+            else:
+                st.warning("Нет выполненных подходов для сохранения!")
+    
+    else:
+        # Создаем таблицу для ввода данных по всем упражнениям
+        st.subheader(f"Упражнения для {workout}")
     
-    # Создаем вкладки для каждого упражнения
-    tabs = st.tabs([exercise for exercise in WORKOUTS[workout]])
+        # Создаем вкладки для каждого упражнения
+        tabs = st.tabs([exercise for exercise in WORKOUTS[workout]])
     
-    for i, exercise in enumerate(WORKOUTS[workout]):
-        with tabs[i]:
-            # Получаем данные предыдущей тренировки
-            prev_workout_data = get_previous_workout_data(data, workout, exercise)
+        for i, exercise in enumerate(WORKOUTS[workout]):
+            with tabs[i]:
+                # Получаем данные предыдущей тренировки
+                prev_workout_data = last_sessions.previous(workout, exercise)
             
-            # Определяем количество подходов (по умолчанию 3, но можно изменить)
-            sets = st.number_input(f"Количество подходов", min_value=1, max_value=5, value=3, key=f"sets_{exercise}")
+                # Определяем количество подходов (по умолчанию 3, но можно изменить)
+                sets = st.number_input(f"Количество подходов", min_value=1, max_value=5, value=3, key=f"sets_{exercise}")
             
-            # Создаем контейнер для подходов
-            for set_num in range(1, sets + 1):
-                st.write(f"### Подход {set_num}")
+                # Создаем контейнер для подходов
+                for set_num in range(1, sets + 1):
+                    st.write(f"### Подход {set_num}")
                 
-                # Значения по умолчанию из предыдущей тренировки
-                default_reps = 10
-                default_weight = 20.0
+                    # Значения по умолчанию из предыдущей тренировки
+                    default_reps = 10
+                    default_weight = 20.0
                 
-                if prev_workout_data is not None and not prev_workout_data.empty:
-                    # Находим данные для этого подхода
-                    set_data = prev_workout_data[prev_workout_data['Подход'] == set_num]
-                    if not set_data.empty:
-                        default_reps = int(set_data.iloc[0]['Повторения'])
-                        default_weight = float(set_data.iloc[0]['Вес'])
+                    if prev_workout_data is not None and not prev_workout_data.empty:
+                        # Находим данные для этого подхода
+                        set_data = prev_workout_data[prev_workout_data['Подход'] == set_num]
+                        if not set_data.empty:
+                            default_reps = int(set_data.iloc[0]['Повторения'])
+                            default_weight = float(set_data.iloc[0]['Вес'])
                 
-                # Статус подхода (выполнен или нет)
-                set_status = st.checkbox(f"Подход выполнен", key=f"{exercise}_status_{set_num}")
+                    # Статус подхода (выполнен или нет)
+                    set_status = st.checkbox(f"Подход выполнен", key=f"{exercise}_status_{set_num}")
                 
-                if set_status:
-                    # Если подход выполнен, показываем поля для ввода данных
-                    col1, col2 = st.columns(2)
+                    if set_status:
+                        # Если подход выполнен, показываем поля для ввода данных
+                        col1, col2 = st.columns(2)
+                    
+                        with col1:
+                            reps = st.number_input(f"Повторения", 
+                                                  min_value=1, 
+                                                  max_value=100, 
+                                                  value=default_reps, 
+                                                  key=f"{exercise}_reps_{set_num}")
+                        with col2:
+                            weight = st.number_input(f"Вес (кг)", 
+                                                    min_value=0.0, 
+                                                    max_value=500.0, 
+                                                    value=default_weight,
+                                                    step=2.5, 
+                                                    key=f"{exercise}_weight_{set_num}")
                     
-                    with col1:
-                        reps = st.number_input(f"Повторения", 
+                        # Меняем стиль, чтобы показать, что подход выполнен
+                        st.markdown("""
+                        <style>
+                        div[data-testid="stCheckbox"]:has(input:checked) + div {
+                            background-color: #d4f7d4;
+                            padding: 10px;
+                            border-radius: 5px;
+                        }
+                        </style>
+                        """, unsafe_allow_html=True)
+                    else:
+                        # Если подход не выполнен, показываем данные предыдущей тренировки
+                        st.info(f"Предыдущий результат: {default_reps} повторений × {default_weight} кг")
+                        # Скрытые поля для сохранения значений
+                        reps = st.number_input(f"Повторения (скрыто)", 
                                               min_value=1, 
                                               max_value=100, 
                                               value=default_reps, 
-                                              key=f"{exercise}_reps_{set_num}")
-                    with col2:
-                        weight = st.number_input(f"Вес (кг)", 
+                                              key=f"{exercise}_hidden_reps_{set_num}",
+                                              label_visibility="collapsed")
+                        weight = st.number_input(f"Вес (скрыто)", 
                                                 min_value=0.0, 
                                                 max_value=500.0, 
                                                 value=default_weight,
                                                 step=2.5, 
-                                                key=f"{exercise}_weight_{set_num}")
-                    
-                    # Меняем стиль, чтобы показать, что подход выполнен
-                    st.markdown("""
-                    <style>
-                    div[data-testid="stCheckbox"]:has(input:checked) + div {
-                        background-color: #d4f7d4;
-                        padding: 10px;
-                        border-radius: 5px;
-                    }
-                    </style>
-                    """, unsafe_allow_html=True)
-                else:
-                    # Если подход не выполнен, показываем данные предыдущей тренировки
-                    st.info(f"Предыдущий результат: {default_reps} повторений × {default_weight} кг")
-                    # Скрытые поля для сохранения значений
-                    reps = st.number_input(f"Повторения (скрыто)", 
-                                          min_value=1, 
-                                          max_value=100, 
-                                          value=default_reps, 
-                                          key=f"{exercise}_hidden_reps_{set_num}",
-                                          label_visibility="collapsed")
-                    weight = st.number_input(f"Вес (скрыто)", 
-                                            min_value=0.0, 
-                                            max_value=500.0, 
-                                            value=default_weight,
-                                            step=2.5, 
-                                            key=f"{exercise}_hidden_weight_{set_num}",
-                                            label_visibility="collapsed")
+                                                key=f"{exercise}_hidden_weight_{set_num}",
+                                                label_visibility="collapsed")
             
-            # Кнопка для сохранения данных для этого упражнения
-            if st.button(f"Сохранить {exercise}", key=f"save_{exercise}", type="primary"):
-                # Сохраняем только выполненные подходы
-                saved = False
-                for set_num in range(1, sets + 1):
-                    # Проверяем статус подхода
-                    set_status = st.session_state.get(f"{exercise}_status_{set_num}", False)
-                    if set_status:
-                        # Получаем значения из соответствующих полей
-                        reps = st.session_state.get(f"{exercise}_reps_{set_num}", default_reps)
-                        weight = st.session_state.get(f"{exercise}_weight_{set_num}", default_weight)
-                        
-                        # Сохраняем данные
-                        data = add_workout_data(str(date), workout, exercise, set_num, reps, weight)
-                        saved = True
-                
-                if saved:
-                    st.success(f"Данные для {exercise} сохранены!")
-                else:
-                    st.warning("Нет выполненных подходов для сохранения!")
+                # Кнопка для сохранения данных для этого упражнения
+                if st.button(f"Сохранить {exercise}", key=f"save_{exercise}", type="primary"):
+                    # Сохраняем только выполненные подходы, все сразу
+                    completed = get_completed_sets(date, workout, exercise)
+                    if completed:
+                        if save_completed_sets(completed):
+                            st.success(f"Данные для {exercise} сохранены!")
+                    else:
+                        st.warning("Нет выполненных подходов для сохранения!")
+    
+        # Сохранение всей тренировки по всем вкладкам одной транзакцией
+        if st.button("Сохранить всю тренировку", key="save_workout"):
+            completed = []
+            for exercise in WORKOUTS[workout]:
+                completed.extend(get_completed_sets(date, workout, exercise))
+            if completed:
+                if save_completed_sets(completed):
+                    st.success(f"Сохранено подходов: {len(completed)}")
+            else:
+                st.warning("Нет выполненных подходов для сохранения!")
 
 elif mode == "История тренировок":
     st.header("История тренировок")
@@ -374,8 +428,15 @@ elif mode == "История тренировок":
     with col2:
         exercise_filter = st.selectbox("Фильтр по упражнению", ["Все"] + sum(WORKOUTS.values(), []))
     
+    data = empty_data()
+    if storage_error is None:
+        try:
+            data = load_data()
+        except StorageError as e:
+            st.error(str(e))
+    
     # Фильтрация данных
-    filtered_data = data.copy()
+    filtered_data = data
     if workout_filter != "Все":
         filtered_data = filtered_data[filtered_data['Тренировка'] == workout_filter]
     if exercise_filter != "Все":
@@ -385,74 +446,111 @@ elif mode == "История тренировок":
     filtered_data = filtered_data.sort_values(by=['Дата', 'Тренировка', 'Упражнение', 'Подход'], ascending=[False, True, True, True])
     
     if not filtered_data.empty:
-        # Группируем по дате и тренировке для более удобного просмотра
-        unique_date_workouts = filtered_data[['Дата', 'Тренировка']].drop_duplicates()
+        # Группируем по дате и тренировке одним проходом: для каждой
+        # тренировки сразу известны позиции ее строк
+        sessions = filtered_data.groupby(['Дата', 'Тренировка'], sort=False, observed=True).indices
+        session_keys = list(filtered_data[['Дата', 'Тренировка']].drop_duplicates().itertuples(index=False, name=None))
         
-        for _, row in unique_date_workouts.iterrows():
-            date_str = row['Дата']
-            workout_type = row['Тренировка']
-            
-            with st.expander(f"{date_str} - {workout_type}"):
+        # Показываем только одну страницу тренировок
+        pages = (len(session_keys) - 1) // HISTORY_PAGE_SIZE + 1
+        page = st.number_input("Страница", min_value=1, max_value=pages, value=1) if pages > 1 else 1
+        first = (page - 1) * HISTORY_PAGE_SIZE
+        page_keys = session_keys[first:first + HISTORY_PAGE_SIZE]
+        st.caption(f"Тренировки {first + 1}–{first + len(page_keys)} из {len(session_keys)}")
+        
+        for date, workout_type in page_keys:
+            with st.expander(f"{date:%Y-%m-%d} - {workout_type}"):
                 # Показываем данные для этой даты и тренировки
-                day_data = filtered_data[(filtered_data['Дата'] == date_str) & 
-                                         (filtered_data['Тренировка'] == workout_type)]
+                day_data = filtered_data.iloc[sessions[(date, workout_type)]]
                 
-                # Группируем по упражнениям
-                for exercise in sorted(day_data['Упражнение'].unique()):
+                # Группируем по упражнениям (строки уже отсортированы по упражнению)
+                for exercise, exercise_data in day_data.groupby('Упражнение', sort=False, observed=True):
                     st.write(f"#### {exercise}")
                     
-                    # Получаем данные для этого упражнения
-                    exercise_data = day_data[day_data['Упражнение'] == exercise]
-                    
                     # Создаем таблицу
                     st.table(exercise_data[['Подход', 'Повторения', 'Вес']])
     else:
         st.info("Нет данных для отображения. Записывайте свои тренировки в режиме 'Запись тренировки'.")
+    
+    # Выгрузка всей истории. Файл собирается частями только по нажатию
+    # кнопки и не кэшируется: он размером со всю историю
+    with st.expander("Выгрузить все данные"):
+        export_format = st.selectbox("Формат", list(EXPORT_FORMATS), key="export_format")
+        if st.button("Подготовить файл", key="export_prepare"):
+            try:
+                export = b"".join(iter_export(export_format))
+            except StorageError as e:
+                st.error(str(e))
+            else:
+                st.download_button(f"Скачать workout_data.{export_format}", export,
+                                   file_name=f"workout_data.{export_format}",
+                                   mime=EXPORT_FORMATS[export_format], key="export_download")
+
+elif mode == "Сводка по упражнениям":
+    st.header("Сводка по упражнениям")
+    
+    if get_progress_index().empty:
+        st.info("Нет данных для анализа. Начните записывать свои тренировки.")
+    else:
+        # Показатели всех упражнений считаются один раз на версию данных
+        summary, series, bucket = get_exercise_dashboard()
+        st.dataframe(summary, use_container_width=True, column_config={
+            "Макс. вес": st.column_config.NumberColumn(format="%.1f кг"),
+            "Последняя": st.column_config.DateColumn(format="YYYY-MM-DD"),
+            "Последний вес": st.column_config.NumberColumn(format="%.1f кг"),
+            "1ПМ": st.column_config.NumberColumn("Расчетный 1ПМ", format="%.1f кг"),
+            "Прогресс, %": st.column_config.NumberColumn(format="%.1f"),
+            "Тренд, %": st.column_config.NumberColumn(format="%.1f", help="Изменение веса за последние 5 тренировок"),
+        })
+        
+        # Маленькие графики максимального веса, по одному на упражнение
+        fig = cached_render("dashboard", (), lambda: build_dashboard_figure(series))
+        st.plotly_chart(fig, use_container_width=True)
+        if bucket:
+            st.caption(f"Максимальный вес по {bucket}")
 
 else:  # Анализ прогресса
     st.header("Анализ прогресса")
     
-    if data.empty:
+    # Показатели по дням берем из готовой сводки
+    progress_index = get_progress_index()
+    
+    if progress_index.empty:
         st.info("Нет данных для анализа. Начните записывать свои тренировки.")
     else:
         # Выбор упражнения для анализа
         exercise = st.selectbox("Выберите упражнение для анализа", sum(WORKOUTS.values(), []))
         
-        # Фильтрация данных по упражнению
-        exercise_data = data[data['Упражнение'] == exercise].copy()
-        
-        if not exercise_data.empty:
-            # Преобразуем даты в формат datetime для корректной сортировки
-            exercise_data['Дата'] = pd.to_datetime(exercise_data['Дата'])
-            exercise_data = exercise_data.sort_values('Дата')
+        if exercise in progress_index.index.get_level_values(0):
+            history = progress_index.xs(exercise, level=0)
+            best_results = history.reset_index()
             
-            # Вычисляем лучшие показатели для каждой тренировки
-            best_results = exercise_data.groupby('Дата').agg({
-                'Повторения': 'max',
-                'Вес': 'max'
-            }).reset_index()
+            # Длинную историю можно сузить до периода: он берется из сводки
+            # заново в полной детализации
+            period = None
+            if len(history) > CHART_MAX_POINTS:
+                first_day, last_day = history.index[0].date(), history.index[-1].date()
+                period = st.slider("Период графиков", min_value=first_day, max_value=last_day,
+                                   value=(first_day, last_day), format="YYYY-MM-DD")
             
-            # Преобразуем даты обратно в строки для отображения
-            best_results['Дата'] = best_results['Дата'].dt.strftime('%Y-%m-%d')
-            exercise_data['Дата'] = exercise_data['Дата'].dt.strftime('%Y-%m-%d')
+            # Готовые графики переиспользуются, пока данные не изменились
+            fig_weight, fig_reps, (n_points, bucket) = cached_render(
+                "progress", (exercise, period), lambda: build_progress_figures(history, exercise, period))
+            if bucket:
+                st.caption(f"Точек на графике: {n_points}, дни сведены по {bucket}. "
+                           "Сузьте период, чтобы увидеть отдельные дни.")
             
             # График изменения максимального веса
             st.subheader(f"Прогресс по весу - {exercise}")
-            fig_weight = px.line(best_results, x='Дата', y='Вес', markers=True,
-                                title=f"Изменение максимального веса для {exercise}")
-            fig_weight.update_layout(xaxis_title="Дата", yaxis_title="Вес (кг)")
             st.plotly_chart(fig_weight, use_container_width=True)
             
             # График изменения максимальных повторений
             st.subheader(f"Прогресс по повторениям - {exercise}")
-            fig_reps = px.line(best_results, x='Дата', y='Повторения', markers=True,
-                              title=f"Изменение максимальных повторений для {exercise}")
-            fig_reps.update_layout(xaxis_title="Дата", yaxis_title="Повторения")
             st.plotly_chart(fig_reps, use_container_width=True)
             
             # Статистика
             st.subheader("Статистика")
-            col1, col2, col3 = st.columns(3)
+            col1, col2, col3, col4 = st.columns(4)
             with col1:
                 st.metric("Максимальный вес", f"{best_results['Вес'].max()} кг")
             with col2:
@@ -465,21 +563,36 @@ else:  # Анализ прогресса
                     st.metric("Прогресс по весу", f"{progress:.1f}%")
                 else:
                     st.metric("Прогресс по весу", "Недостаточно данных")
+            with col4:
+                st.metric("Расчетный 1ПМ", f"{best_results['1ПМ'].iloc[-1]:.1f} кг")
             
             # Таблица с детальными данными по дням
             st.subheader("История тренировок")
             
-            # Группируем по датам для удобства просмотра
-            unique_dates = sorted(exercise_data['Дата'].unique(), reverse=True)
-            
-            for date in unique_dates:
-                with st.expander(f"Тренировка {date}"):
-                    date_data = exercise_data[exercise_data['Дата'] == date]
+            # Группируем по датам одним проходом, сначала новые
+            exercise_data = read_exercise_sets(exercise)
+            for date, date_data in reversed(list(exercise_data.groupby('Дата'))):
+                with st.expander(f"Тренировка {date:%Y-%m-%d}"):
                     st.table(date_data[['Подход', 'Повторения', 'Вес']])
                     
         else:
             st.info(f"Нет данных для упражнения '{exercise}'")
 
+page_span.end()
+
+# Состояние синхронизации с Gist
+if get_gist_credentials() is not None:
+    sync_worker = gist_sync_worker()
+    st.sidebar.markdown("---")
+    if sync_worker.pending_count:
+        st.sidebar.warning(f"Ожидают отправки в Gist: {sync_worker.pending_count}")
+    else:
+        st.sidebar.success("Все данные отправлены в Gist")
+    if sync_worker.last_synced:
+        st.sidebar.caption(f"Последняя синхронизация: {sync_worker.last_synced.replace('T', ' ')}")
+    if sync_worker.last_error:
+        st.sidebar.error(f"Ошибка синхронизации: {sync_worker.last_error}")
+
 # Информация о программе
 st.sidebar.markdown("---")
 st.sidebar.info("""
@@ -490,9 +603,31 @@ st.sidebar.info("""
     переменных GIST_ID и GITHUB_TOKEN.
 """)
 
+# Панель замеров производительности: участки текущего перезапуска
+profile_spans = PROFILER.finish_run()
+if st.sidebar.checkbox("Замеры производительности", key="profile_panel"):
+    if profile_spans:
+        st.sidebar.dataframe(pd.DataFrame(profile_spans), hide_index=True, use_container_width=True)
+        st.sidebar.caption(f"Всего: {sum(span['ms'] for span in profile_spans):.1f} мс. Журнал: {PROFILE_LOG_FILE}")
+    else:
+        st.sidebar.caption("Замеры появятся после следующего действия")
+
 # Добавляем стили для мобильного устройства
 st.markdown("""
 <style>
+    /* Календарь месяца: семь колонок равной ширины */
+    table.workout-calendar {
+        width: 100%;
+        table-layout: fixed;
+        border-collapse: separate;
+        border-spacing: 4px;
+    }
+    table.workout-calendar th, table.workout-calendar td {
+        border: none;
+        text-align: center;
+        vertical-align: top;
+        padding: 4px;
+    }
     /* Улучшение для мобильных устройств */
     @media (max-width: 768px) {
         .stNumberInput input {
@@ -0,0 +1,94 @@
+"""Генератор синтетической истории тренировок в формате workout_data.csv.
+
+Каждый пользователь тренируется 3-4 раза в неделю по циклу A -> B -> C -> D,
+иногда пропускает неделю, делает 3-5 подходов по 6-12 повторений и
+постепенно прибавляет в весе. В данных нет колонки пользователя (приложение
+хранит всех в одном файле), поэтому несколько пользователей означают
+пропорционально больше строк в каждый день.
+
+Пример:
+    python benchmarks/generate_data.py --years 5 --users 10 -o synthetic.csv
+"""
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['Дата', 'Тренировка', 'Упражнение', 'Подход', 'Повторения', 'Вес']
+
+
+def generate_user_data(workouts, years, rng, end_date):
+    workout_names = list(workouts)
+    days = int(years * 365)
+    start = np.datetime64(end_date) - np.timedelta64(days, 'D')
+
+    # Дни тренировок: в среднем через день, плюс редкие пропущенные недели
+    gaps = rng.choice([1, 2, 2, 2, 3], size=days)
+    gaps[rng.random(days) < 0.02] += 7
+    offsets = np.cumsum(gaps)
+    offsets = offsets[offsets <= days]
+    session_dates = start + offsets.astype('timedelta64[D]')
+    session_workouts = np.arange(len(offsets)) % len(workout_names)
+
+    # Упражнения каждой тренировки и подходы каждого упражнения
+    exercises_per_workout = np.array([len(workouts[name]) for name in workout_names])
+    exercise_counts = exercises_per_workout[session_workouts]
+    exercise_session = np.repeat(np.arange(len(offsets)), exercise_counts)
+    exercise_pos = np.arange(len(exercise_session)) - np.repeat(np.cumsum(exercise_counts) - exercise_counts, exercise_counts)
+    set_counts = rng.integers(3, 6, size=len(exercise_session))
+    set_exercise = np.repeat(np.arange(len(exercise_session)), set_counts)
+    set_num = np.arange(len(set_exercise)) - np.repeat(np.cumsum(set_counts) - set_counts, set_counts) + 1
+
+    session_of_set = exercise_session[set_exercise]
+    workout_of_set = session_workouts[session_of_set]
+    exercise_names = np.array([workouts[name][pos] for name in workout_names for pos in range(len(workouts[name]))])
+    exercise_index = (np.cumsum(exercises_per_workout) - exercises_per_workout)[workout_of_set] + exercise_pos[set_exercise]
+
+    # Рабочий вес растет примерно на 10% в год, с шумом и шагом 2.5 кг
+    base_weight = rng.uniform(10, 80, size=len(exercise_names))
+    growth = 1 + 0.1 * offsets[session_of_set] / 365
+    weight = base_weight[exercise_index] * growth * rng.normal(1, 0.03, size=len(set_num))
+    weight = np.maximum(np.round(weight / 2.5) * 2.5, 0)
+
+    return pd.DataFrame({
+        'Дата': np.datetime_as_string(session_dates[session_of_set], unit='D'),
+        'Тренировка': np.array(workout_names)[workout_of_set],
+        'Упражнение': exercise_names[exercise_index],
+        'Подход': set_num,
+        'Повторения': rng.integers(6, 13, size=len(set_num)),
+        'Вес': weight,
+    })
+
+
+def generate_workout_data(workouts, years=1, users=1, seed=0, end_date=None):
+    """Сгенерировать историю тренировок users пользователей за years лет"""
+    rng = np.random.default_rng(seed)
+    end_date = end_date or datetime.date.today()
+    frames = [generate_user_data(workouts, years, rng, end_date) for _ in range(users)]
+    data = pd.concat(frames, ignore_index=True)
+    # Как в настоящем файле: строки идут в порядке записи
+    return data.sort_values('Дата', kind='stable', ignore_index=True)[COLUMNS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, default=1)
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    # Файла по умолчанию нет, чтобы случайно не затереть настоящий workout_data.csv
+    parser.add_argument('-o', '--output', required=True, help='куда записать CSV')
+    args = parser.parse_args()
+
+    # Программа тренировок берется из приложения
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from workout_core import WORKOUTS
+    data = generate_workout_data(WORKOUTS, args.years, args.users, args.seed)
+    data.to_csv(args.output, index=False)
+    print(f"{len(data)} строк записано в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""Нагрузочный тест записи: несколько сессий одновременно сохраняют подходы.
+
+Каждая сессия - поток, как сессия Streamlit в одном процессе; с --processes
+такие же потоки запускаются в нескольких процессах над одним каталогом
+данных, как несколько экземпляров приложения. Каждый сохраненный подход
+помечен сессией и номером сохранения, поэтому после теста можно проверить,
+что ни одно подтвержденное сохранение не потерялось. Выводятся пропускная
+способность, перцентили задержки сохранения и число потерянных подходов.
+
+    python benchmarks/load_test.py --sessions 8 --saves 20
+    python benchmarks/load_test.py --backend csv journal sqlite parquet gist --years 1
+    python benchmarks/load_test.py --backend csv --processes 4 -o load.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+import pandas as pd
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import workout_core as core  # noqa: E402
+from benchmarks.generate_data import generate_workout_data  # noqa: E402
+from benchmarks.run_benchmarks import GIST_ID, FakeGistApi  # noqa: E402
+
+# С этого дня пишутся подходы теста, по дню на сохранение: этих дней нет
+# в сгенерированной истории
+LOAD_TEST_DATE = '2099-01-01'
+WORKOUT = "Тренировка A"
+EXERCISE = core.WORKOUTS[WORKOUT][0]
+# Переменные окружения каждого хранилища
+BACKENDS = {
+    'csv': {},
+    'journal': {'JOURNAL_MODE': '1'},
+    'sqlite': {'STORAGE_BACKEND': 'sqlite'},
+    'parquet': {'STORAGE_BACKEND': 'parquet'},
+    'gist': {'GIST_ID': GIST_ID, 'GITHUB_TOKEN': 'load-test'},
+}
+# Сколько секунд ждать, пока фоновый поток отправит сохранения в Gist
+GIST_FLUSH_TIMEOUT = 60
+
+
+def session_sets(session, save, batch):
+    """Подходы одного сохранения.
+    
+    Ключи подходов у всех сессий и сохранений разные, иначе upsert заменял бы
+    одни подходы другими: день - номер сохранения, номер подхода включает
+    номер сессии. Вес - номер сессии, повторения - номер сохранения.
+    """
+    date = str((pd.Timestamp(LOAD_TEST_DATE) + pd.Timedelta(days=save)).date())
+    return [(date, WORKOUT, EXERCISE, session * batch + i + 1, save, float(session)) for i in range(batch)]
+
+
+def run_session(session, saves, batch, start, results):
+    latencies = []
+    saved = []
+    errors = 0
+    start.wait()
+    for save in range(saves):
+        sets = session_sets(session, save, batch)
+        began = time.perf_counter()
+        try:
+            core.add_workout_sets(sets)
+        except Exception:
+            # StorageError показывается пользователю, остальное - сбой сессии
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - began) * 1000)
+        saved += [(set_num, reps, weight) for _, _, _, set_num, reps, weight in sets]
+    results.append({'latencies': latencies, 'saved': saved, 'errors': errors})
+
+
+def run_sessions(first_session, sessions, saves, batch):
+    """Запустить sessions потоков-сессий и дождаться их. Возвращает результаты и время"""
+    start = threading.Event()
+    results = []
+    threads = [
+        threading.Thread(target=run_session, args=(first_session + i, saves, batch, start, results))
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    began = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - began
+
+
+def run_process(args):
+    """Сессии одного процесса при --processes"""
+    workdir, env, first_session, sessions, saves, batch = args
+    os.chdir(workdir)
+    os.environ.update(env)
+    results, _ = run_sessions(first_session, sessions, saves, batch)
+    return results
+
+
+def stored_sets(data):
+    """Подходы теста, которые есть в данных: {(подход, повторения, вес)}"""
+    rows = data[data['Дата'] >= pd.Timestamp(LOAD_TEST_DATE)]
+    return set(zip(rows['Подход'].astype(int), rows['Повторения'].astype(int), rows['Вес'].astype(float)))
+
+
+def gist_data(fake_gist):
+    """Данные, которые оказались в заглушке Gist"""
+    manifest = json.loads(fake_gist.files.get(core.GIST_MANIFEST_FILE, '{"shards": {}}'))
+    frames = [core.read_csv(StringIO(fake_gist.files[info['file']])) for info in manifest['shards'].values()]
+    return core.apply_schema(pd.concat(frames, ignore_index=True)) if frames else core.empty_data()
+
+
+def wait_for_gist_sync():
+    deadline = time.monotonic() + GIST_FLUSH_TIMEOUT
+    worker = core.gist_sync_worker()
+    while worker.pending_count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return not worker.pending_count
+
+
+def percentile(values, q):
+    if len(values) < 2:
+        return round(values[0], 2) if values else None
+    return round(statistics.quantiles(values, n=100, method='inclusive')[q - 1], 2)
+
+
+def run_load_test(backend, years, sessions, processes, saves, batch, fake_gist):
+    workdir = tempfile.mkdtemp(prefix='workout-load-')
+    env = BACKENDS[backend]
+    saved_env = {name: os.environ.get(name) for name in set().union(*BACKENDS.values())}
+    for name in saved_env:
+        os.environ.pop(name, None)
+    os.chdir(workdir)
+    core.clear_caches()
+    try:
+        data = generate_workout_data(core.WORKOUTS, years)
+        if backend == 'gist':
+            fake_gist.files.clear()
+            core.push_to_gist(requests.Session(), GIST_ID, 'load-test', data)
+            shutil.rmtree(core.GIST_CACHE_DIR, ignore_errors=True)
+        else:
+            data.to_csv(core.DATA_FILE, index=False)
+        os.environ.update(env)
+        core.load_data()
+
+        if processes == 1:
+            results, elapsed = run_sessions(0, sessions, saves, batch)
+        else:
+            # Новые процессы запускаются без общего с этим процессом состояния
+            context = multiprocessing.get_context('spawn')
+            tasks = [(workdir, env, p * sessions, sessions, saves, batch) for p in range(processes)]
+            began = time.perf_counter()
+            with context.Pool(processes) as pool:
+                results = sum(pool.map(run_process, tasks), [])
+            elapsed = time.perf_counter() - began
+
+        # Итоговые данные читаются заново, мимо кэшей этого процесса
+        synced = True
+        if backend == 'gist':
+            synced = wait_for_gist_sync()
+            stored = stored_sets(gist_data(fake_gist))
+        else:
+            core.clear_caches()
+            stored = stored_sets(core.load_data())
+    finally:
+        os.chdir(ROOT)
+        for name, value in saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        core.clear_caches()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(sum((result['latencies'] for result in results), []))
+    saved = set().union(*(result['saved'] for result in results))
+    return {
+        'backend': backend,
+        'years': years,
+        'sessions': sessions,
+        'processes': processes,
+        'saves': len(latencies),
+        'sets': len(saved),
+        'errors': sum(result['errors'] for result in results),
+        'saves_per_s': round(len(latencies) / elapsed, 2),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'lost_sets': len(saved - stored),
+        'gist_synced': synced,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', nargs='+', choices=list(BACKENDS), default=['csv', 'sqlite'])
+    parser.add_argument('--years', type=float, default=1, help='длина истории до начала теста')
+    parser.add_argument('--sessions', type=int, default=8, help='сессий в каждом процессе')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--saves', type=int, default=20, help='сохранений на сессию')
+    parser.add_argument('--batch', type=int, default=3, help='подходов в одном сохранении')
+    parser.add_argument('-o', '--output', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+    if args.processes * args.sessions * args.batch > 127:
+        # Номер подхода хранится в int8
+        parser.error('processes * sessions * batch должно быть не больше 127')
+    if args.processes > 1 and 'gist' in args.backend:
+        parser.error('заглушка Gist живет в памяти процесса, для gist нужен --processes 1')
+
+    # Тест идет во временных каталогах, путь считается от каталога запуска
+    output = args.output and os.path.abspath(args.output)
+    fake_gist = FakeGistApi()
+    results = []
+    with mock.patch.object(requests.Session, 'request', fake_gist.request):
+        for backend in args.backend:
+            result = run_load_test(backend, args.years, args.sessions, args.processes,
+                                   args.saves, args.batch, fake_gist)
+            results.append(result)
+            flag = '' if result['gist_synced'] else '  (Gist не синхронизирован)'
+            print(f"{backend:7} {args.processes} x {args.sessions} сессий: {result['saves_per_s']:>8.1f} сохр/с, "
+                  f"p50 {result['p50_ms']:.1f} p95 {result['p95_ms']:.1f} p99 {result['p99_ms']:.1f} мс, "
+                  f"потеряно {result['lost_sets']} из {result['sets']} подходов, ошибок {result['errors']}{flag}",
+                  flush=True)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, ensure_ascii=False, indent=1)
+        print(f"Результаты сохранены в {output}")
+    sys.exit(1 if any(result['lost_sets'] for result in results) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+"""Замеры производительности функций данных и страниц приложения.
+
+Для каждого сочетания длины истории, числа пользователей и хранилища
+(локальный CSV, Gist, Parquet или SQLite) генерирует данные, замеряет функции работы с
+данными и каждую страницу приложения без сервера Streamlit (через AppTest)
+и сохраняет результаты в JSON. Gist API заменяется заглушкой в памяти,
+поэтому сеть не используется.
+
+    python benchmarks/run_benchmarks.py --years 1 5 10 --users 1 10 -o results.json
+    python benchmarks/run_benchmarks.py --compare old.json results.json
+"""
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import pandas as pd
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, 'app.py')
+sys.path.insert(0, ROOT)
+
+import workout_core as core  # noqa: E402
+from benchmarks.generate_data import generate_workout_data  # noqa: E402
+
+PAGES = ["Календарь", "Запись тренировки", "История тренировок", "Анализ прогресса", "Сводка по упражнениям"]
+GIST_ID = 'benchmark'
+# Во сколько раз результат может замедлиться, прежде чем --compare сочтет это регрессией
+REGRESSION_RATIO = 1.2
+
+
+class FakeGistApi:
+    """Заглушка GitHub Gist API: хранит файлы в памяти и считает запросы и байты"""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = 0
+        self.bytes = 0
+
+    def etag(self):
+        state = json.dumps(self.files, sort_keys=True).encode('utf-8')
+        return '"' + hashlib.sha1(state).hexdigest() + '"'
+
+    def response(self, status, body=None, etag=None):
+        response = requests.Response()
+        response.status_code = status
+        response._content = json.dumps(body).encode('utf-8') if body is not None else b''
+        if etag:
+            response.headers['ETag'] = etag
+        self.bytes += len(response._content)
+        return response
+
+    def request(self, method, url, headers=None, data=None, **kwargs):
+        self.requests += 1
+        if data:
+            self.bytes += len(data)
+        if method == 'GET':
+            etag = self.etag()
+            if (headers or {}).get('If-None-Match') == etag:
+                return self.response(304)
+            files = {
+                name: {'filename': name, 'content': content, 'truncated': False}
+                for name, content in self.files.items()
+            }
+            return self.response(200, {'files': files, 'updated_at': etag}, etag)
+        if method == 'PATCH':
+            for name, file in json.loads(data)['files'].items():
+                if file is None:
+                    self.files.pop(name, None)
+                else:
+                    self.files[name] = file['content']
+            return self.response(200, {'files': {}}, self.etag())
+        return self.response(404, {})
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return {
+        'median_ms': round(statistics.median(times), 3),
+        'min_ms': round(min(times), 3),
+        'max_ms': round(max(times), 3),
+        'runs': repeat,
+    }
+
+
+def run_page(mode):
+    """Выполнить страницу app.py без сервера Streamlit.
+
+    AppTest запускает скрипт в этом же процессе, поэтому страница работает
+    с теми же кэшами workout_core, что и замеры функций.
+    """
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=600)
+    at.session_state['mode'] = mode
+    at.run()
+    if at.exception:
+        raise RuntimeError(f"{mode}: {at.exception[0].value}")
+
+
+def run_scenario(backend, years, users, repeat, fake_gist):
+    """Замерить все функции и страницы на одном наборе данных"""
+    data = generate_workout_data(core.WORKOUTS, years, users)
+    workdir = tempfile.mkdtemp(prefix='workout-bench-')
+    os.chdir(workdir)
+    core.clear_caches()
+    os.environ.pop('STORAGE_BACKEND', None)
+    if backend == 'gist':
+        os.environ.update({'GIST_ID': GIST_ID, 'GITHUB_TOKEN': 'benchmark'})
+        fake_gist.files.clear()
+        core.push_to_gist(requests.Session(), GIST_ID, 'benchmark', data)
+        shutil.rmtree(core.GIST_CACHE_DIR, ignore_errors=True)
+    else:
+        os.environ.pop('GIST_ID', None)
+        os.environ.pop('GITHUB_TOKEN', None)
+        data.to_csv(core.DATA_FILE, index=False)
+    if backend == 'parquet':
+        core.convert_csv_to_parquet(core.DATA_FILE, core.PARQUET_DIR)
+        os.environ['STORAGE_BACKEND'] = 'parquet'
+    elif backend == 'sqlite':
+        # База создается из CSV при первом обращении, как в приложении
+        os.environ['STORAGE_BACKEND'] = 'sqlite'
+        core.sqlite_storage()
+    # Функции получают данные в тех же типах, что и в приложении
+    data = core.apply_schema(data)
+    last_month = data['Дата'].max() - pd.offsets.MonthBegin(1)
+
+    def cold_load():
+        core.clear_caches()
+        shutil.rmtree(core.GIST_CACHE_DIR, ignore_errors=True)
+        core.load_data()
+
+    def build_indexes():
+        core.data_indexes()['entries'].clear()
+        core.get_last_session_index()
+        core.get_daily_index()
+        core.get_progress_index()
+
+    exercise = core.WORKOUTS["Тренировка A"][0]
+    # Каждое сохранение - новый подход на день без истории, иначе повторы
+    # замерили бы upsert без записи
+    tomorrow = str(datetime.date.today() + datetime.timedelta(days=1))
+    set_numbers = itertools.count(1)
+    benchmarks = [
+        ('load_data (холодный)', cold_load),
+        ('load_data (повторный)', core.load_data),
+        ('get_workout_dates', lambda: core.get_workout_dates(data)),
+        ('get_previous_workout_data', lambda: core.get_previous_workout_data(data, "Тренировка A", exercise)),
+        ('recommend_next_workout', lambda: core.recommend_next_workout(data)),
+        ('индексы (построение)', build_indexes),
+        ('read_sets (месяц, 3 колонки)', lambda: core.read_sets(last_month, None, ['Дата', 'Упражнение', 'Вес'])),
+        ('add_workout_data', lambda: core.add_workout_data(tomorrow, "Тренировка A", exercise, next(set_numbers), 10, 20.0)),
+    ]
+    benchmarks += [(f'страница: {mode}', lambda mode=mode: run_page(mode)) for mode in PAGES]
+
+    results = []
+    try:
+        for name, fn in benchmarks:
+            requests_before, bytes_before = fake_gist.requests, fake_gist.bytes
+            result = {'benchmark': name, 'backend': backend, 'years': years, 'users': users, 'rows': len(data)}
+            result.update(measure(fn, repeat))
+            result['http_requests'] = fake_gist.requests - requests_before
+            result['http_bytes'] = fake_gist.bytes - bytes_before
+            results.append(result)
+            print(f"{backend:7} {years:>4} лет {users:>4} польз. {name:40} {result['median_ms']:>10.2f} мс", flush=True)
+    finally:
+        os.environ.pop('STORAGE_BACKEND', None)
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """Сравнить два файла результатов. Возвращает число регрессий"""
+    def key(result):
+        return (result['benchmark'], result['backend'], result['years'], result['users'])
+
+    with open(old_path, encoding='utf-8') as f:
+        old = {key(result): result for result in json.load(f)['results']}
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['results']
+
+    regressions = 0
+    for result in new:
+        before = old.get(key(result))
+        if before is None or not before['median_ms']:
+            continue
+        ratio = result['median_ms'] / before['median_ms']
+        flag = ''
+        if ratio > REGRESSION_RATIO:
+            flag = '  <-- регрессия'
+            regressions += 1
+        print(f"{result['backend']:7} {result['years']:>4} {result['users']:>4} {result['benchmark']:40} "
+              f"{before['median_ms']:>10.2f} -> {result['median_ms']:>10.2f} мс  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5])
+    parser.add_argument('--users', type=int, nargs='+', default=[1])
+    parser.add_argument('--backend', nargs='+', choices=['local', 'gist', 'parquet', 'sqlite'], default=['local', 'gist'])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('-o', '--output', default='bench_output.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='сравнить два файла результатов вместо запуска замеров')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+    # Замеры идут во временных каталогах, путь считается от каталога запуска
+    output = os.path.abspath(args.output)
+
+    fake_gist = FakeGistApi()
+    with mock.patch.object(requests.Session, 'request', fake_gist.request):
+        results = []
+        for backend in args.backend:
+            for years in args.years:
+                for users in args.users:
+                    results += run_scenario(backend, years, users, args.repeat, fake_gist)
+
+    report = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"Результаты сохранены в {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Замер холодного старта: время импорта модулей и первой загрузки страниц.
+
+Каждый замер выполняется в новом процессе Python с -X importtime, поэтому
+кэши модулей и данных всегда пустые, как при старте контейнера. Для каждой
+страницы выводится время первого запуска скрипта и самые тяжелые модули,
+импортированные по пути.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --years 5 --top 15 -o startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.generate_data import generate_workout_data  # noqa: E402
+
+PAGES = ["Календарь", "Запись тренировки", "История тренировок", "Анализ прогресса", "Сводка по упражнениям"]
+
+# Первый запуск страницы. Время замеряется внутри процесса, импорт самого
+# AppTest в замер не входит; imported - модули, загруженные скриптом страницы
+PAGE_SCRIPT = '''
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+at.session_state['mode'] = sys.argv[2]
+before = set(sys.modules)
+start = time.perf_counter()
+at.run()
+print(json.dumps({
+    'ms': (time.perf_counter() - start) * 1000,
+    'exception': bool(at.exception),
+    'imported': sorted(set(sys.modules) - before),
+}))
+'''
+
+
+def parse_importtime(stderr):
+    """Разобрать вывод -X importtime: {модуль: (собственное, суммарное время в мс)}"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        parts = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules[parts[2]] = (int(parts[0]) / 1000, int(parts[1]) / 1000)
+    return modules
+
+
+def run_python(code, *args, cwd=None):
+    # Страницы запускаются в каталоге с данными, а workout_core лежит в ROOT
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get('PYTHONPATH')])))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code, *args],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    return result.stdout, parse_importtime(result.stderr)
+
+
+def heaviest(modules, top, names=None):
+    """Самые тяжелые пакеты верхнего уровня по суммарному времени импорта"""
+    packages = {
+        name: times[1] for name, times in modules.items()
+        if '.' not in name and (names is None or name in names)
+    }
+    return [[name, round(ms, 1)] for name, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]]
+
+
+def measure_import(module, top):
+    _, modules = run_python(f'import {module}', cwd=ROOT)
+    return {
+        'name': f'import {module}',
+        'ms': round(modules[module][1], 1),
+        'heaviest': heaviest(modules, top),
+    }
+
+
+def measure_page(mode, workdir, top):
+    stdout, modules = run_python(PAGE_SCRIPT, os.path.join(ROOT, 'app.py'), mode, cwd=workdir)
+    result = json.loads(stdout.strip().splitlines()[-1])
+    return {
+        'name': f'страница: {mode}',
+        'ms': round(result['ms'], 1),
+        'exception': result['exception'],
+        # Импорты, которые пришлись на первую загрузку страницы
+        'heaviest': heaviest(modules, top, set(result['imported'])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=float, default=1, help='длина синтетической истории')
+    parser.add_argument('--top', type=int, default=8, help='сколько тяжелых пакетов показывать')
+    parser.add_argument('-o', '--output', help='сохранить результаты в JSON')
+    args = parser.parse_args()
+
+    import workout_core
+    workdir = tempfile.mkdtemp(prefix='workout-startup-')
+    try:
+        data = generate_workout_data(workout_core.WORKOUTS, args.years)
+        data.to_csv(os.path.join(workdir, workout_core.DATA_FILE), index=False)
+
+        results = [measure_import('workout_core', args.top), measure_import('streamlit', args.top)]
+        results += [measure_page(mode, workdir, args.top) for mode in PAGES]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for result in results:
+        flag = '  (ошибка в скрипте)' if result.get('exception') else ''
+        print(f"{result['name']:40} {result['ms']:>10.1f} мс{flag}")
+        for name, ms in result['heaviest']:
+            print(f"    {name:36} {ms:>10.1f} мс")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, ensure_ascii=False, indent=1)
+        print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Поведение хранилищ: upsert, удаление повторов, журнал, очередь Gist.
+
+Каждый тест работает в пустом временном каталоге со сброшенными кэшами
+workout_core. Gist API заменяется заглушкой из benchmarks, сеть не нужна.
+
+    python -m pytest tests
+"""
+import os
+import sys
+import threading
+import time
+from io import StringIO
+
+import pandas as pd
+import pytest
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import workout_core as core  # noqa: E402
+from benchmarks.run_benchmarks import FakeGistApi  # noqa: E402
+
+WORKOUT = "Тренировка A"
+EXERCISE = core.WORKOUTS[WORKOUT][0]
+# Переменные окружения каждого хранилища
+BACKENDS = {
+    'csv': {},
+    'journal': {'JOURNAL_MODE': '1'},
+    'sqlite': {'STORAGE_BACKEND': 'sqlite'},
+    'parquet': {'STORAGE_BACKEND': 'parquet'},
+}
+GIST_ENV = {'GIST_ID': 'test', 'GITHUB_TOKEN': 'test'}
+# Сколько секунд ждать фоновую синхронизацию с Gist
+SYNC_TIMEOUT = 10
+
+
+def workout_set(day, set_num, reps=10, weight=50.0):
+    return (f'2025-01-{day:02d}', WORKOUT, EXERCISE, set_num, reps, weight)
+
+
+def stored(data):
+    """Подходы в виде списка кортежей (день, подход, повторения, вес) в порядке хранения"""
+    return list(zip(data['Дата'].dt.day, data['Подход'].astype(int),
+                    data['Повторения'].astype(int), data['Вес'].astype(float)))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Пустой каталог данных, переменные хранилищ сброшены"""
+    monkeypatch.chdir(tmp_path)
+    for name in set().union(*BACKENDS.values(), GIST_ENV):
+        monkeypatch.delenv(name, raising=False)
+    core.clear_caches()
+    yield tmp_path
+    core.clear_caches()
+
+
+@pytest.fixture(params=list(BACKENDS))
+def backend(request, workdir, monkeypatch):
+    for name, value in BACKENDS[request.param].items():
+        monkeypatch.setenv(name, value)
+    return request.param
+
+
+class SwitchableGist(FakeGistApi):
+    """Заглушка Gist, которую можно отключить, как пропавшую сеть"""
+
+    def __init__(self):
+        super().__init__()
+        self.online = True
+
+    def request(self, method, url, headers=None, data=None, **kwargs):
+        if not self.online:
+            raise requests.ConnectionError("нет сети")
+        return super().request(method, url, headers=headers, data=data, **kwargs)
+
+    def data(self):
+        """Подходы, которые лежат в Gist"""
+        shards = [content for name, content in self.files.items() if name != core.GIST_MANIFEST_FILE]
+        if not shards:
+            return core.empty_data()
+        return core.apply_schema(pd.concat([core.read_csv(StringIO(content)) for content in shards],
+                                           ignore_index=True))
+
+
+@pytest.fixture
+def gist(workdir, monkeypatch):
+    fake = SwitchableGist()
+    monkeypatch.setattr(requests.Session, 'request',
+                        lambda session, method, url, **kwargs: fake.request(method, url, **kwargs))
+    for name, value in GIST_ENV.items():
+        monkeypatch.setenv(name, value)
+    return fake
+
+
+def wait_for_sync():
+    worker = core.gist_sync_worker()
+    worker.wakeup.set()
+    deadline = time.monotonic() + SYNC_TIMEOUT
+    while worker.pending_count and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return worker.pending_count == 0
+
+
+def test_resaving_set_is_noop(backend):
+    core.add_workout_sets([workout_set(1, 1), workout_set(1, 2)])
+    version = core.get_data_version()
+
+    saved = core.add_workout_sets([workout_set(1, 1), workout_set(1, 2)])
+
+    assert saved.empty
+    assert core.get_data_version() == version
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0), (1, 2, 10, 50.0)]
+
+
+def test_update_changes_row_in_place(backend):
+    core.add_workout_sets([workout_set(1, 1), workout_set(1, 2), workout_set(1, 3)])
+
+    saved = core.add_workout_sets([workout_set(1, 2, reps=12, weight=55.0)])
+
+    assert stored(saved) == [(1, 2, 12, 55.0)]
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0), (1, 2, 12, 55.0), (1, 3, 10, 50.0)]
+
+
+def test_update_is_seen_by_next_save(backend):
+    # Индекс ключей обновляется на месте: возврат к прежним значениям - тоже изменение
+    core.add_workout_sets([workout_set(1, 1)])
+    core.add_workout_sets([workout_set(1, 1, reps=12)])
+
+    saved = core.add_workout_sets([workout_set(1, 1)])
+
+    assert stored(saved) == [(1, 1, 10, 50.0)]
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0)]
+
+
+def test_deduplicate_data_keeps_last_row_per_key(workdir):
+    # Файл, сохраненный до upsert: один подход записан трижды
+    pd.DataFrame([workout_set(1, 1, reps=8), workout_set(1, 2), workout_set(1, 1, reps=9),
+                  workout_set(1, 1, reps=10, weight=52.5)], columns=core.COLUMNS).to_csv(core.DATA_FILE, index=False)
+
+    assert core.deduplicate_data() == 2
+
+    core.clear_caches()
+    assert stored(core.load_data()) == [(1, 2, 10, 50.0), (1, 1, 10, 52.5)]
+    assert core.deduplicate_data() == 0
+
+
+def test_journal_survives_torn_tail(workdir, monkeypatch):
+    monkeypatch.setenv('JOURNAL_MODE', '1')
+    core.add_workout_sets([workout_set(1, 1)])
+    # Сбой посреди дописывания оставил обрывок строки
+    with open(core.JOURNAL_FILE, 'a', encoding='utf-8') as f:
+        f.write(f'2025-01-02,{WORKOUT},{EXERCISE[:3]}')
+    core.clear_caches()
+
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0)]
+
+    core.add_workout_sets([workout_set(3, 1)])
+    core.clear_caches()
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0), (3, 1, 10, 50.0)]
+
+    core.compact_journal()
+    core.clear_caches()
+    assert not os.path.exists(core.JOURNAL_FILE)
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0), (3, 1, 10, 50.0)]
+
+
+def test_interrupted_compaction_keeps_one_row_per_set(workdir, monkeypatch):
+    monkeypatch.setenv('JOURNAL_MODE', '1')
+    core.add_workout_sets([workout_set(1, 1), workout_set(2, 1)])
+    # Сворачивание заменило основной файл, но упало до удаления журнала
+    os.replace(core.JOURNAL_FILE, core.JOURNAL_COMPACTING_FILE)
+    core.write_data_file(core.read_csv(core.JOURNAL_COMPACTING_FILE))
+    core.clear_caches()
+
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0), (2, 1, 10, 50.0)]
+
+    core.compact_journal()
+    core.clear_caches()
+    assert not os.path.exists(core.JOURNAL_COMPACTING_FILE)
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0), (2, 1, 10, 50.0)]
+
+
+def test_concurrent_saves_are_not_lost(backend):
+    errors = []
+
+    def save(session):
+        try:
+            for day in range(1, 6):
+                core.add_workout_sets([workout_set(day, session + 1)])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(session,)) for session in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    core.clear_caches()
+    assert len(core.load_data()) == 20
+
+
+def test_offline_gist_save_is_queued_and_synced_later(gist):
+    core.add_workout_sets([workout_set(1, 1)])
+    assert wait_for_sync()
+
+    # Сеть пропала после того, как истек кэш версии Gist
+    gist.online = False
+    core.invalidate_data_cache()
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0)]
+    core.add_workout_sets([workout_set(2, 1)])
+
+    assert core.gist_sync_worker().pending_count == 1
+    assert stored(core.read_csv(core.DATA_FILE)) == [(1, 1, 10, 50.0), (2, 1, 10, 50.0)]
+    assert stored(core.load_data()) == [(1, 1, 10, 50.0), (2, 1, 10, 50.0)]
+
+    gist.online = True
+    assert wait_for_sync()
+    assert stored(gist.data()) == [(1, 1, 10, 50.0), (2, 1, 10, 50.0)]
+
+
+def test_offline_without_any_copy_raises_storage_error(gist):
+    gist.online = False
+
+    with pytest.raises(core.StorageError):
+        core.add_workout_sets([workout_set(1, 1)])
+
+
+def test_gist_sync_deletes_emptied_month(gist):
+    core.add_workout_sets([workout_set(1, 1), ('2025-02-01', WORKOUT, EXERCISE, 1, 10, 50.0)])
+    assert wait_for_sync()
+    assert 'workout_2025-02.csv' in gist.files
+
+    core.save_data(core.load_data().iloc[:1])
+    assert wait_for_sync()
+
+    assert 'workout_2025-02.csv' not in gist.files
+    assert stored(gist.data()) == [(1, 1, 10, 50.0)]
@@ -0,0 +1,2012 @@
+"""Данные трекера тренировок без интерфейса.
+
+Хранилища (локальный CSV с журналом, GitHub Gist, SQLite), индексы для
+страниц и расчеты прогресса. Модуль не зависит от Streamlit, поэтому его
+можно импортировать в пакетных задачах и замерах:
+
+    import workout_core
+    data = workout_core.load_data()
+    workout_core.get_workout_dates(data)
+
+Кэши живут в процессе и общие для всех сессий Streamlit.
+"""
+import argparse
+import collections
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from io import BytesIO, StringIO
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: записи из разных процессов не блокируются, только из потоков
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Определение тренировок и упражнений
+WORKOUTS = {
+    "Тренировка A": ["Жим лежа", "Приседания", "Тяга в наклоне", "Жим плечами", "Сгибание рук", "Разгибание трицепса"],
+    "Тренировка B": ["Жим ногами", "Становая тяга", "Подтягивания", "Отжимания на брусьях", "Скручивания", "Икроножные"],
+    "Тренировка C": ["Наклонный жим", "Выпады", "Тяга верхнего блока", "Разведение рук", "Молотки", "Пресс"],
+    "Тренировка D": ["Гакк-приседания", "Румынская тяга", "Гребля", "Подъемы в стороны", "Бицепс на скамье", "Пуловер"]
+}
+
+DATA_FILE = 'workout_data.csv'
+COLUMNS = ['Дата', 'Тренировка', 'Упражнение', 'Подход', 'Повторения', 'Вес']
+# Естественный ключ подхода: повторное сохранение того же подхода
+# обновляет строку, а не добавляет новую
+KEY_COLUMNS = ['Дата', 'Тренировка', 'Упражнение', 'Подход']
+
+# Типы колонок в памяти. Тренировки и упражнения - категории из WORKOUTS
+# (тренировки упорядочены по циклу), даты - datetime64, числа - компактные.
+# Названия, которых нет в WORKOUTS, добавляются в категории при загрузке
+SCHEMA = {
+    'Дата': 'datetime64[ns]',
+    'Тренировка': pd.CategoricalDtype(list(WORKOUTS), ordered=True),
+    'Упражнение': pd.CategoricalDtype(list(dict.fromkeys(sum(WORKOUTS.values(), [])))),
+    'Подход': 'int8',
+    'Повторения': 'int16',
+    'Вес': 'float32',
+}
+# Формат дат в CSV, Gist и SQLite
+DATE_FORMAT = '%Y-%m-%d'
+
+# Файл блокировки записи: сохранения из разных сессий и процессов
+# (несколько экземпляров приложения, пакетные задачи) идут по очереди
+WRITE_LOCK_FILE = 'workout_data.lock'
+# Сколько секунд ждать чужое сохранение, прежде чем сообщить об ошибке
+WRITE_LOCK_TIMEOUT = 30
+
+# Журнал новых подходов (режим JOURNAL_MODE=1). При сворачивании журнал
+# переименовывается в JOURNAL_COMPACTING_FILE и вливается в DATA_FILE
+JOURNAL_FILE = 'workout_data.journal.csv'
+JOURNAL_COMPACTING_FILE = 'workout_data.journal.compacting.csv'
+# Размер журнала в байтах, после которого запускается сворачивание
+JOURNAL_COMPACT_BYTES = 256 * 1024
+
+# Данные в Gist хранятся помесячно: workout_2025-03.csv и т.д. плюс манифест
+# со списком месяцев. GIST_FILE - прежний единый файл, читается для совместимости
+GIST_FILE = 'workout_data.csv'
+GIST_MANIFEST_FILE = 'workout_manifest.json'
+GIST_SHARD_FILE = 'workout_{month}.csv'
+# Локальная копия последней загруженной версии Gist
+GIST_CACHE_DIR = '.gist_cache'
+# Как часто (в секундах) проверять, не появилась ли новая ревизия Gist
+GIST_VERSION_TTL = 30
+# Таймаут запросов к GitHub API в секундах
+GIST_TIMEOUT = 15
+# Очередь неотправленных в Gist сохранений и паузы между повторными попытками
+GIST_SYNC_QUEUE_FILE = os.path.join(GIST_CACHE_DIR, 'sync_queue.json')
+GIST_SYNC_RETRY_MIN = 5
+GIST_SYNC_RETRY_MAX = 300
+
+# Хранилище: csv (локальный файл или Gist), sqlite или parquet (STORAGE_BACKEND)
+SQLITE_FILE = 'workout_data.db'
+# Снимок в Parquet: каталог с файлом на каждый месяц, 2025-03.parquet и т.д.
+PARQUET_DIR = 'workout_data.parquet'
+
+# Журнал замеров производительности (JSON Lines). Замеры включаются флажком
+# в боковой панели или для всех сессий переменной WORKOUT_PROFILE=1
+PROFILE_LOG_FILE = 'workout_profile.jsonl'
+
+class ProfileSpan:
+    """Замер одного участка: длительность и счетчики (строки, байты)"""
+    
+    def __init__(self, profiler, run, name):
+        self.profiler = profiler
+        self.run = run
+        self.name = name
+        self.counters = {}
+    
+    def begin(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def end(self, **counters):
+        self.counters.update(counters)
+        record = {
+            'span': self.name,
+            'ms': round((time.perf_counter() - self.start) * 1000, 3),
+            **self.counters
+        }
+        if self.run is not None:
+            self.run['spans'].append(record)
+        else:
+            self.profiler.write([record])
+    
+    def __enter__(self):
+        self.begin()
+        return self.counters
+    
+    def __exit__(self, *exc_info):
+        self.end()
+
+class NullSpan:
+    """Замер, который ничего не делает, - когда замеры выключены"""
+    
+    def begin(self):
+        return self
+    
+    def end(self, **counters):
+        pass
+    
+    def __enter__(self):
+        # Свой словарь на каждый замер: записанные в него счетчики просто пропадают
+        return {}
+    
+    def __exit__(self, *exc_info):
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Profiler:
+    """Легкие замеры времени горячих участков.
+    
+    Замеры собираются отдельно для каждого перезапуска скрипта, то есть для
+    каждой сессии Streamlit. Участки вне перезапуска (фоновая синхронизация)
+    пишутся в журнал сразу. Когда замеры выключены, span() возвращает
+    готовый пустой замер и почти ничего не стоит.
+    """
+    
+    def __init__(self, log_file):
+        self.log_file = log_file
+        self.always = os.environ.get('WORKOUT_PROFILE') == '1'
+        self.local = threading.local()
+        self.lock = threading.Lock()
+    
+    def start_run(self, enabled):
+        if enabled or self.always:
+            self.local.run = {'id': uuid.uuid4().hex[:8], 'spans': []}
+        else:
+            self.local.run = None
+    
+    def finish_run(self):
+        """Завершить перезапуск и записать его замеры в журнал"""
+        run = getattr(self.local, 'run', None)
+        self.local.run = None
+        if not run:
+            return []
+        self.write(run['spans'], run['id'])
+        return run['spans']
+    
+    def enabled(self):
+        """Идут ли замеры в текущем потоке. Дорогие счетчики считаются только тогда"""
+        return self.always or getattr(self.local, 'run', None) is not None
+    
+    def span(self, name):
+        if not self.enabled():
+            return NULL_SPAN
+        return ProfileSpan(self, getattr(self.local, 'run', None), name)
+    
+    def write(self, spans, run_id=None):
+        if not spans:
+            return
+        ts = time.time()
+        lines = ''.join(json.dumps({'ts': ts, 'run': run_id, **span}, ensure_ascii=False) + '\n' for span in spans)
+        with self.lock, open(self.log_file, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+PROFILER = Profiler(PROFILE_LOG_FILE)
+
+class StorageError(Exception):
+    """Данные не удалось прочитать из хранилища"""
+
+def shared_resource(func):
+    """Один объект на процесс, общий для всех сессий (аналог st.cache_resource)"""
+    lock = threading.Lock()
+    
+    @functools.wraps(func)
+    def wrapper():
+        with lock:
+            if 'value' not in wrapper.__dict__:
+                wrapper.value = func()
+            return wrapper.value
+    
+    wrapper.clear = lambda: wrapper.__dict__.pop('value', None)
+    return wrapper
+
+def ttl_cache(ttl):
+    """Кэш результатов на ttl секунд (аналог st.cache_data(ttl=...)).
+    
+    Исключения не кэшируются, следующий вызов попробует снова.
+    """
+    def decorator(func):
+        lock = threading.Lock()
+        entries = {}
+        
+        @functools.wraps(func)
+        def wrapper(*args):
+            now = time.monotonic()
+            with lock:
+                entry = entries.get(args)
+            if entry is not None and now - entry[0] < ttl:
+                return entry[1]
+            value = func(*args)
+            with lock:
+                entries[args] = (now, value)
+            return value
+        
+        def clear():
+            with lock:
+                entries.clear()
+        
+        wrapper.clear = clear
+        return wrapper
+    return decorator
+
+# Функции для работы с данными
+def empty_data():
+    return apply_schema(pd.DataFrame(columns=COLUMNS))
+
+def with_schema_categories(values, dtype):
+    """Категории из SCHEMA плюс встретившиеся в данных названия не из WORKOUTS"""
+    extra = pd.Index(values.dropna().unique()).difference(dtype.categories)
+    if not extra.empty:
+        dtype = pd.CategoricalDtype(list(dtype.categories) + sorted(extra), ordered=dtype.ordered)
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values.astype(dtype)
+    if values.cat.categories.equals(dtype.categories) and values.cat.ordered == dtype.ordered:
+        return values
+    # astype не меняет порядок неупорядоченных категорий, если их набор
+    # совпадает, поэтому порядок задается явно
+    return values.cat.set_categories(dtype.categories, ordered=dtype.ordered)
+
+def apply_schema(df):
+    """Привести данные к типам SCHEMA.
+    
+    Сравнение с категорией - сравнение целых кодов, а не строк, поэтому
+    фильтры по тренировке и упражнению быстрее и данные занимают в разы
+    меньше памяти. Даты разбираются один раз здесь. Если в df только часть
+    колонок, приводятся они.
+    """
+    columns = [column for column in COLUMNS if column in df]
+    typed = {}
+    for column in columns:
+        if column == 'Дата':
+            # Уже разобранные даты (склейка типизированных частей) не разбираются снова
+            dates = df[column]
+            typed[column] = dates if dates.dtype == SCHEMA[column] else pd.to_datetime(dates, format=DATE_FORMAT)
+        elif isinstance(SCHEMA[column], pd.CategoricalDtype):
+            typed[column] = with_schema_categories(df[column], SCHEMA[column])
+        else:
+            typed[column] = df[column].astype(SCHEMA[column])
+    return pd.DataFrame(typed, index=df.index)
+
+# Параметры pd.read_csv для файлов с подходами
+CSV_READ_OPTIONS = {
+    'dtype': {'Тренировка': 'category', 'Упражнение': 'category'},
+    'parse_dates': ['Дата'],
+    'date_format': DATE_FORMAT,
+}
+
+def read_csv(source):
+    """Прочитать CSV с подходами сразу в компактные типы"""
+    return apply_schema(pd.read_csv(source, **CSV_READ_OPTIONS))
+
+def read_csv_chunks(source, chunk_rows):
+    """То же, что read_csv, частями по chunk_rows строк"""
+    with pd.read_csv(source, chunksize=chunk_rows, **CSV_READ_OPTIONS) as reader:
+        for chunk in reader:
+            yield apply_schema(chunk)
+
+def write_csv(df, target, **kwargs):
+    df.to_csv(target, index=False, date_format=DATE_FORMAT, **kwargs)
+
+@shared_resource
+def gist_session():
+    """Общая HTTP-сессия для GitHub API: соединения переиспользуются между запросами"""
+    # requests нужен только при настроенном Gist, без него импорт модуля быстрее
+    import requests
+    session = requests.Session()
+    session.headers.update({'Accept': 'application/vnd.github.v3+json'})
+    return session
+
+def gist_cache_paths(gist_id):
+    """Файлы локальной копии Gist: метаданные с ETag и разобранный DataFrame"""
+    return (os.path.join(GIST_CACHE_DIR, f'{gist_id}.json'),
+            os.path.join(GIST_CACHE_DIR, f'{gist_id}.pkl'))
+
+def read_gist_cache_meta(gist_id):
+    meta_path, data_path = gist_cache_paths(gist_id)
+    if not os.path.exists(meta_path) or not os.path.exists(data_path):
+        return None
+    with open(meta_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def write_gist_cache(gist_id, etag, df, manifest=None, legacy=False):
+    """Сохранить на диск копию Gist вместе с ETag, под которым она получена.
+    
+    manifest - манифест помесячных файлов этой версии, legacy - есть ли
+    в Gist прежний единый файл.
+    """
+    os.makedirs(GIST_CACHE_DIR, exist_ok=True)
+    meta_path, data_path = gist_cache_paths(gist_id)
+    df.to_pickle(f'{data_path}.tmp')
+    os.replace(f'{data_path}.tmp', data_path)
+    with open(f'{meta_path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'etag': etag, 'manifest': manifest, 'legacy': legacy}, f)
+    os.replace(f'{meta_path}.tmp', meta_path)
+
+def month_of(dates):
+    """Месяц 'ГГГГ-ММ' для каждой даты - ключ помесячного файла"""
+    return pd.to_datetime(dates).dt.strftime('%Y-%m')
+
+def key_index(df):
+    """Ключи KEY_COLUMNS строк df как MultiIndex для поиска по хешу"""
+    return pd.MultiIndex.from_arrays([df[column].to_numpy() for column in KEY_COLUMNS])
+
+def missing_rows(df, other):
+    """Строки df, ключей которых нет в other"""
+    return df[~key_index(df).isin(key_index(other))]
+
+def deduplicate(df):
+    """Оставить по одной строке на ключ - последнюю записанную"""
+    return df.drop_duplicates(KEY_COLUMNS, keep='last', ignore_index=True)
+
+def upsert_rows(df, rows):
+    """df, в котором строки с ключами из rows заменены на rows, а новые ключи дописаны в конец.
+    
+    Замененные строки остаются на своих местах. В rows ключи не повторяются.
+    """
+    rows_index = key_index(rows)
+    positions = rows_index.get_indexer(key_index(df))
+    replaced = positions >= 0
+    if not replaced.any():
+        return apply_schema(pd.concat([df, rows], ignore_index=True))
+    df = df.copy()
+    for column in ('Повторения', 'Вес'):
+        df.loc[replaced, column] = rows[column].to_numpy()[positions[replaced]]
+    inserted = rows[~rows_index.isin(key_index(df))]
+    return apply_schema(pd.concat([df, inserted], ignore_index=True))
+
+def split_into_shards(df):
+    """Разбить данные по месяцам: {месяц: DataFrame}"""
+    return dict(list(df.groupby(month_of(df['Дата']), sort=True)))
+
+def read_gist_file(session, file_info):
+    # Содержимое больших файлов API отдает обрезанным, целиком оно доступно по raw_url
+    if not file_info.get('truncated'):
+        return file_info['content']
+    with PROFILER.span('http GET raw') as counters:
+        response = session.get(file_info['raw_url'], timeout=GIST_TIMEOUT)
+        response.raise_for_status()
+        counters['bytes'] = len(response.content)
+    return response.text
+
+def read_gist_shards(session, gist_id, files, manifest, cached_meta):
+    """Собрать данные из помесячных файлов Gist.
+    
+    Месяцы с той же контрольной суммой, что и в локальной копии, берутся из нее,
+    заново разбираются (и при необходимости скачиваются) только изменившиеся.
+    """
+    cached_shards = ((cached_meta or {}).get('manifest') or {}).get('shards', {})
+    cached_months = {}
+    if any(cached_shards.get(month, {}).get('sha1') == info['sha1']
+           for month, info in manifest['shards'].items()):
+        _, data_path = gist_cache_paths(gist_id)
+        cached_df = pd.read_pickle(data_path)
+        cached_months = split_into_shards(cached_df)
+    
+    frames = []
+    for month, info in sorted(manifest['shards'].items()):
+        if cached_shards.get(month, {}).get('sha1') == info['sha1'] and month in cached_months:
+            frames.append(cached_months[month])
+        else:
+            frames.append(read_csv(StringIO(read_gist_file(session, files[info['file']]))))
+    
+    if not frames:
+        return empty_data()
+    return pd.concat(frames, ignore_index=True)
+
+@ttl_cache(GIST_VERSION_TTL)
+def fetch_gist_version(gist_id, github_token):
+    """Проверить Gist условным запросом и вернуть ETag актуальной версии.
+    
+    Если Gist не менялся, GitHub отвечает 304 без тела и данные берутся из
+    локальной копии. Иначе новая версия разбирается и сохраняется на диск.
+    """
+    session = gist_session()
+    headers = {'Authorization': f'token {github_token}'}
+    meta = read_gist_cache_meta(gist_id)
+    if meta and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    
+    with PROFILER.span('http GET gist') as counters:
+        response = session.get(
+            f'https://api.github.com/gists/{gist_id}',
+            headers=headers,
+            timeout=GIST_TIMEOUT
+        )
+        counters.update(status=response.status_code, bytes=len(response.content))
+    if response.status_code == 304:
+        return meta['etag']
+    response.raise_for_status()
+    
+    gist_data = response.json()
+    files = gist_data['files']
+    manifest = None
+    if GIST_MANIFEST_FILE in files:
+        manifest = json.loads(read_gist_file(session, files[GIST_MANIFEST_FILE]))
+        df = read_gist_shards(session, gist_id, files, manifest, meta)
+    elif GIST_FILE in files:
+        df = read_csv(StringIO(read_gist_file(session, files[GIST_FILE])))
+    else:
+        df = empty_data()
+    
+    etag = response.headers.get('ETag')
+    write_gist_cache(gist_id, etag, df, manifest, legacy=GIST_FILE in files)
+    # Без ETag версию определяет время изменения Gist
+    return etag or gist_data.get('updated_at')
+
+def file_version(path):
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def get_gist_credentials():
+    """Пара (GIST_ID, GITHUB_TOKEN) или None, если Gist не настроен"""
+    gist_id = os.environ.get('GIST_ID')
+    github_token = os.environ.get('GITHUB_TOKEN')
+    if not gist_id or not github_token:
+        return None
+    return gist_id, github_token
+
+def storage_backend():
+    return os.environ.get('STORAGE_BACKEND', 'csv')
+
+def get_data_version():
+    """Версия данных: mtime и размер файлов локально, ревизия Gist удаленно"""
+    if storage_backend() == 'sqlite':
+        return ('sqlite', sqlite_storage().version())
+    if storage_backend() == 'parquet':
+        return ('parquet', parquet_storage().version())
+    
+    credentials = get_gist_credentials()
+    
+    # Пока в очереди есть неотправленные сохранения, свежее всего локальная копия
+    if credentials is None or gist_sync_worker().pending_count:
+        return ('local',) + tuple(file_version(path) for path in local_data_files())
+    
+    gist_id, github_token = credentials
+    try:
+        return ('gist', gist_id, fetch_gist_version(gist_id, github_token))
+    except OSError as e:
+        # GitHub недоступен (ошибки requests - OSError): работаем с последней
+        # полученной копией Gist, а без нее - с локальными файлами. Сохранение
+        # запишется локально и уйдет в Gist из очереди, когда связь появится
+        meta = read_gist_cache_meta(gist_id)
+        if meta is not None:
+            logger.warning("Gist недоступен (%s), данные из локальной копии Gist", e)
+            return ('gist', gist_id, meta.get('etag'))
+        if any(os.path.exists(path) for path in local_data_files()):
+            logger.warning("Gist недоступен (%s), данные из локальных файлов", e)
+            return ('local',) + tuple(file_version(path) for path in local_data_files())
+        raise
+
+def local_data_files():
+    """Файлы, из которых складываются локальные данные, в порядке записи"""
+    return [DATA_FILE, JOURNAL_COMPACTING_FILE, JOURNAL_FILE]
+
+@functools.lru_cache(maxsize=2)
+def read_snapshot(path, version):
+    """Разобранный основной файл. Кэшируется по версии файла: пока он не
+    переписан, при дописывании журнала заново читается только журнал"""
+    return read_csv(path)
+
+def read_journal(path):
+    """Прочитать журнал без недописанной последней строки.
+    
+    Сбой посреди дописывания оставляет в конце обрывок строки без перевода
+    строки. Сохранение этих подходов не было подтверждено, обрывок пропускается.
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    complete = content[:content.rfind(b'\n') + 1]
+    if not complete:
+        return empty_data()
+    return read_csv(BytesIO(complete))
+
+def trim_torn_tail(path):
+    """Отрезать от журнала недописанную последнюю строку, чтобы новая запись не склеилась с ней"""
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        f.seek(0)
+        content = f.read()
+        f.truncate(content.rfind(b'\n') + 1)
+        logger.warning("Журнал %s оборван посреди строки, обрывок удален", path)
+
+def read_local_data():
+    """Прочитать основной файл и хвост журнала"""
+    paths = [path for path in local_data_files() if os.path.exists(path)]
+    with PROFILER.span('csv read') as counters:
+        frames = [read_snapshot(path, file_version(path)) if path == DATA_FILE else read_journal(path)
+                  for path in paths]
+        counters['rows'] = sum(len(frame) for frame in frames)
+        if PROFILER.enabled():
+            counters['bytes'] = sum(os.path.getsize(path) for path in paths)
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return empty_data()
+    if len(frames) == 1:
+        return frames[0]
+    # Категории файлов могут различаться, схема приводит их к общим
+    data = apply_schema(pd.concat(frames, ignore_index=True))
+    if JOURNAL_COMPACTING_FILE in paths:
+        # Сворачивание могло упасть после замены основного файла, тогда строки
+        # журнала есть и в нем. Как и при сворачивании, остается последняя запись
+        data = deduplicate(data)
+    return data
+
+@functools.lru_cache(maxsize=4)
+def read_data(version):
+    """Прочитать данные из хранилища. Результат кэшируется по версии данных.
+    
+    Данные всегда в типах SCHEMA. Один и тот же DataFrame отдается всем
+    вызывающим, изменять его нельзя.
+    """
+    if version[0] == 'sqlite':
+        return sqlite_storage().read()
+    if version[0] == 'parquet':
+        return parquet_storage().read()
+    if version[0] == 'local':
+        return read_local_data()
+    
+    # Актуальная копия Gist уже лежит на диске после fetch_gist_version
+    gist_id = version[1]
+    _, data_path = gist_cache_paths(gist_id)
+    if not os.path.exists(data_path):
+        # Копию удалили вручную - скачиваем Gist заново
+        invalidate_data_cache()
+        fetch_gist_version(gist_id, os.environ.get('GITHUB_TOKEN'))
+    # Копия собрана из месяцев разных версий и могла быть сохранена до
+    # появления схемы, поэтому типы приводятся при каждом чтении
+    return apply_schema(pd.read_pickle(data_path))
+
+def load_data():
+    """Все подходы текущей версии данных.
+    
+    Данные перечитываются только при смене версии, остальные вызовы получают
+    уже разобранный DataFrame из кэша. Ошибки хранилища поднимаются как
+    StorageError и не кэшируются, следующий вызов попробует снова.
+    """
+    try:
+        with PROFILER.span('load_data') as counters:
+            data = read_data(get_data_version())
+            counters['rows'] = len(data)
+        return data
+    except Exception as e:
+        raise StorageError(f"Ошибка при загрузке данных: {e}") from e
+
+def check_storage():
+    """Проверить, что хранилище доступно, не читая историю. Возвращает версию данных.
+    
+    Страницы, которым хватает индексов, вызывают ее вместо load_data.
+    Ошибка поднимается как StorageError с тем же текстом, что и в load_data.
+    """
+    try:
+        return get_data_version()
+    except Exception as e:
+        raise StorageError(f"Ошибка при загрузке данных: {e}") from e
+
+def invalidate_data_cache():
+    """Сбросить кэш версии Gist, чтобы следующая загрузка увидела новые данные"""
+    fetch_gist_version.clear()
+
+def clear_caches():
+    """Сбросить все кэши и общие объекты процесса (для тестов и замеров)"""
+    fetch_gist_version.clear()
+    read_data.cache_clear()
+    read_snapshot.cache_clear()
+    read_exercise_dashboard.cache_clear()
+    for resource in (gist_session, write_lock, journal_lock, gist_sync_worker, sqlite_storage,
+                     parquet_storage, data_indexes, render_cache):
+        resource.clear()
+
+def journal_enabled():
+    return os.environ.get('JOURNAL_MODE') == '1'
+
+class WriteLock:
+    """Блокировка записи данных между потоками и между процессами.
+    
+    Внутри процесса сессии ждут друг друга на RLock, между процессами -
+    на flock файла блокировки. Повторный вход из того же потока разрешен,
+    файл блокируется только внешним входом. Если дождаться не удалось за
+    timeout секунд, поднимается StorageError.
+    """
+    
+    def __init__(self, path, timeout):
+        self.path = path
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+    
+    def __enter__(self):
+        with PROFILER.span('write lock wait'):
+            if not self.lock.acquire(timeout=self.timeout):
+                raise StorageError("Данные сейчас сохраняет другая сессия, попробуйте еще раз")
+            if self.depth == 0:
+                try:
+                    self.file = self.lock_file()
+                except BaseException:
+                    self.lock.release()
+                    raise
+        self.depth += 1
+        return self
+    
+    def lock_file(self):
+        if fcntl is None:
+            return None
+        f = open(self.path, 'a')
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    f.close()
+                    raise StorageError("Данные сейчас сохраняет другой процесс, попробуйте еще раз")
+                time.sleep(0.01)
+    
+    def __exit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0 and self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.lock.release()
+
+@shared_resource
+def write_lock():
+    """Общая блокировка записи данных. Берется раньше journal_lock"""
+    return WriteLock(WRITE_LOCK_FILE, WRITE_LOCK_TIMEOUT)
+
+@shared_resource
+def journal_lock():
+    """Общая для всех сессий блокировка файлов журнала"""
+    return threading.Lock()
+
+def write_data_file(df):
+    # Пишем во временный файл и подменяем им основной, чтобы сбой
+    # не оставил файл наполовину записанным
+    tmp_file = f'{DATA_FILE}.tmp'
+    with PROFILER.span('csv write') as counters:
+        write_csv(df, tmp_file)
+        os.replace(tmp_file, DATA_FILE)
+        counters['rows'] = len(df)
+        if PROFILER.enabled():
+            counters['bytes'] = os.path.getsize(DATA_FILE)
+
+def append_to_journal(new_rows):
+    """Дописать подходы в конец журнала. Стоимость не зависит от размера истории"""
+    with journal_lock(), PROFILER.span('journal append') as counters:
+        counters['rows'] = len(new_rows)
+        if os.path.exists(JOURNAL_FILE):
+            trim_torn_tail(JOURNAL_FILE)
+        write_header = not os.path.exists(JOURNAL_FILE) or os.path.getsize(JOURNAL_FILE) == 0
+        with open(JOURNAL_FILE, 'a', encoding='utf-8', newline='') as f:
+            write_csv(new_rows, f, header=write_header)
+            f.flush()
+            os.fsync(f.fileno())
+        journal_size = os.path.getsize(JOURNAL_FILE)
+    
+    if journal_size >= JOURNAL_COMPACT_BYTES:
+        threading.Thread(target=compact_journal, daemon=True).start()
+
+def compact_journal():
+    """Свернуть журнал в основной файл.
+    
+    Журнал сначала переименовывается, поэтому новые подходы во время
+    сворачивания пишутся уже в свежий журнал. Если процесс упадет между
+    заменой основного файла и удалением старого журнала, следующее
+    сворачивание снова сложит их и оставит по одной строке на ключ.
+    """
+    with write_lock(), journal_lock():
+        if not os.path.exists(JOURNAL_COMPACTING_FILE):
+            if not os.path.exists(JOURNAL_FILE):
+                return
+            os.replace(JOURNAL_FILE, JOURNAL_COMPACTING_FILE)
+        
+        frames = [read_csv(DATA_FILE)] if os.path.exists(DATA_FILE) else []
+        frames.append(read_journal(JOURNAL_COMPACTING_FILE))
+        write_data_file(deduplicate(apply_schema(pd.concat(frames, ignore_index=True))))
+        os.remove(JOURNAL_COMPACTING_FILE)
+
+def save_data(df):
+    with write_lock(), PROFILER.span('save_data') as counters:
+        counters['rows'] = len(df)
+        if storage_backend() in ('sqlite', 'parquet'):
+            table_storage().replace(df)
+            return
+        
+        # Сначала сохраняем локально как резервную копию
+        save_data_locally(df)
+        
+        # Затем пытаемся сохранить в GitHub Gist
+        save_data_to_gist(df)
+
+def save_data_locally(df):
+    with write_lock():
+        if journal_enabled():
+            # Полная перезапись заменяет и основной файл, и журнал
+            with journal_lock():
+                write_data_file(df)
+                for path in (JOURNAL_COMPACTING_FILE, JOURNAL_FILE):
+                    if os.path.exists(path):
+                        os.remove(path)
+        else:
+            write_data_file(df)
+
+def save_data_to_gist(df):
+    if get_gist_credentials() is None:
+        logger.info("Gist не настроен, данные сохранены только локально")
+        return
+    
+    # Данные уже записаны локально, в Gist их отправит фоновый поток
+    with PROFILER.span('save_data_to_gist'):
+        gist_sync_worker().enqueue(len(df))
+
+def push_to_gist(session, gist_id, github_token, df):
+    """Загрузить в Gist изменившиеся помесячные файлы одним PATCH-запросом.
+    
+    Контрольные суммы месяцев сравниваются с манифестом последней известной
+    версии Gist, поэтому новый подход обычно отправляет один файл и манифест.
+    """
+    headers = {'Authorization': f'token {github_token}'}
+    
+    meta = read_gist_cache_meta(gist_id) or {}
+    old_shards = (meta.get('manifest') or {}).get('shards', {})
+    
+    files = {}
+    manifest = {'shards': {}}
+    for month, group in split_into_shards(df).items():
+        filename = GIST_SHARD_FILE.format(month=month)
+        content = group.to_csv(index=False, date_format=DATE_FORMAT)
+        sha1 = hashlib.sha1(content.encode('utf-8')).hexdigest()
+        manifest['shards'][month] = {'file': filename, 'rows': len(group), 'sha1': sha1}
+        if old_shards.get(month, {}).get('sha1') != sha1:
+            files[filename] = {"content": content}
+    # Месяцы, которых больше нет в данных, удаляем
+    for month, info in old_shards.items():
+        if month not in manifest['shards']:
+            files[info['file']] = None
+    
+    if not files and meta.get('manifest') is not None and not meta.get('legacy'):
+        return
+    files[GIST_MANIFEST_FILE] = {"content": json.dumps(manifest, ensure_ascii=False, indent=1)}
+    if meta.get('legacy'):
+        # Все данные прежнего единого файла теперь лежат в помесячных
+        files[GIST_FILE] = None
+    
+    body = json.dumps({"files": files})
+    with PROFILER.span('http PATCH gist') as counters:
+        response = session.patch(
+            f'https://api.github.com/gists/{gist_id}',
+            headers=headers,
+            data=body,
+            timeout=GIST_TIMEOUT
+        )
+        counters.update(status=response.status_code, bytes=len(body) + len(response.content), files=len(files))
+    response.raise_for_status()
+    
+    # Отправленные данные и есть новая версия Gist, скачивать ее не нужно.
+    # Если ETag ответа не совпадет с ETag чтения, Gist просто скачается заново
+    write_gist_cache(gist_id, response.headers.get('ETag'), df, manifest)
+    invalidate_data_cache()
+
+class GistSyncWorker:
+    """Отложенная синхронизация с Gist.
+    
+    Сохранения записываются в очередь на диске и сразу возвращают управление.
+    Фоновый поток отправляет локальную копию данных одним PATCH-запросом за все
+    накопившиеся сохранения, а при ошибке повторяет попытку с растущей паузой.
+    """
+    
+    def __init__(self, session):
+        self.session = session
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        queue = self.read_queue()
+        self.pending_count = len(queue['pending'])
+        self.last_synced = queue['last_synced']
+        self.last_error = None
+        if self.pending_count:
+            # Очередь осталась с прошлого запуска
+            self.wakeup.set()
+        threading.Thread(target=self.run, name='gist-sync', daemon=True).start()
+    
+    def read_queue(self):
+        if not os.path.exists(GIST_SYNC_QUEUE_FILE):
+            return {'pending': [], 'last_synced': None}
+        with open(GIST_SYNC_QUEUE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    
+    def write_queue(self, queue):
+        os.makedirs(GIST_CACHE_DIR, exist_ok=True)
+        with open(f'{GIST_SYNC_QUEUE_FILE}.tmp', 'w', encoding='utf-8') as f:
+            json.dump(queue, f)
+        os.replace(f'{GIST_SYNC_QUEUE_FILE}.tmp', GIST_SYNC_QUEUE_FILE)
+    
+    def enqueue(self, rows):
+        with self.lock:
+            queue = self.read_queue()
+            queue['pending'].append({
+                'queued_at': datetime.datetime.now().isoformat(timespec='seconds'),
+                'rows': rows
+            })
+            self.write_queue(queue)
+            self.pending_count = len(queue['pending'])
+        self.wakeup.set()
+    
+    def run(self):
+        retry_delay = GIST_SYNC_RETRY_MIN
+        delay = None
+        while True:
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            if not self.pending_count:
+                delay = None
+            elif self.sync():
+                retry_delay = GIST_SYNC_RETRY_MIN
+                delay = None
+            else:
+                delay = retry_delay
+                retry_delay = min(retry_delay * 2, GIST_SYNC_RETRY_MAX)
+    
+    def sync(self):
+        credentials = get_gist_credentials()
+        if credentials is None:
+            self.last_error = "Gist ID или GitHub Token не настроены"
+            return False
+        
+        # Сохранения, попавшие в очередь после этой точки, уйдут следующим запросом
+        with self.lock:
+            synced = self.pending_count
+        try:
+            push_to_gist(self.session, *credentials, self.merge_remote(*credentials))
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+        
+        with self.lock:
+            queue = self.read_queue()
+            queue['pending'] = queue['pending'][synced:]
+            queue['last_synced'] = datetime.datetime.now().isoformat(timespec='seconds')
+            self.write_queue(queue)
+            self.pending_count = len(queue['pending'])
+            self.last_synced = queue['last_synced']
+        self.last_error = None
+        return True
+    
+    def merge_remote(self, gist_id, github_token):
+        """Локальные данные, дополненные чужими сохранениями из Gist.
+        
+        Перед отправкой проверяется ревизия Gist: если с прошлой синхронизации
+        его изменил другой экземпляр приложения, недостающие строки Gist
+        дописываются в локальную копию, а не затираются. PATCH в GitHub API
+        условным не бывает, поэтому окно между проверкой и отправкой остается,
+        но сужается до одного запроса.
+        """
+        synced_etag = (read_gist_cache_meta(gist_id) or {}).get('etag')
+        invalidate_data_cache()
+        remote_etag = fetch_gist_version(gist_id, github_token)
+        with write_lock():
+            local = read_local_data()
+            if remote_etag == synced_etag:
+                return local
+            _, data_path = gist_cache_paths(gist_id)
+            foreign = missing_rows(apply_schema(pd.read_pickle(data_path)), local)
+            if foreign.empty:
+                return local
+            logger.info("В Gist %d чужих подходов, дописываем их в локальную копию", len(foreign))
+            merged = apply_schema(pd.concat([local, foreign], ignore_index=True))
+            merged = merged.sort_values('Дата', kind='stable', ignore_index=True)
+            save_data_locally(merged)
+            return merged
+
+@shared_resource
+def gist_sync_worker():
+    return GistSyncWorker(gist_session())
+
+class SqliteStorage:
+    """Хранилище подходов в SQLite.
+    
+    База работает в режиме WAL, чтобы чтение не ждало записи. Индексы
+    обслуживают основные запросы приложения без чтения всей истории:
+    последняя тренировка упражнения, подходы за период и тренировки по дням.
+    Уникальный индекс по ключу подхода (KEY_COLUMNS) делает запись upsert.
+    Счетчик version в таблице meta растет при каждой записи и служит
+    версией данных для кэша.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sets (
+            id INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            workout TEXT NOT NULL,
+            exercise TEXT NOT NULL,
+            set_num INTEGER NOT NULL,
+            reps INTEGER NOT NULL,
+            weight REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sets_exercise_date ON sets (exercise, date);
+        CREATE INDEX IF NOT EXISTS sets_workout_date ON sets (workout, date);
+        CREATE INDEX IF NOT EXISTS sets_date_workout ON sets (date, workout);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    """
+    # Базы, созданные до уникального ключа, могут содержать повторы подходов:
+    # перед созданием индекса остается последняя запись каждого ключа
+    DELETE_DUPLICATES = """
+        DELETE FROM sets WHERE id NOT IN (
+            SELECT MAX(id) FROM sets GROUP BY date, workout, exercise, set_num
+        )
+    """
+    # Колонки таблицы под именами колонок DataFrame
+    SELECT = """
+        SELECT date AS "Дата", workout AS "Тренировка", exercise AS "Упражнение",
+               set_num AS "Подход", reps AS "Повторения", weight AS "Вес"
+        FROM sets
+    """
+    # Ключей в одном запросе stored_values: по 4 параметра, меньше лимита SQLite в 999
+    KEY_BATCH = 200
+    
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        # Одно соединение на процесс, доступ из сессий сериализуется блокировкой
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sets_key'").fetchone():
+            with self.conn:
+                if self.conn.execute(self.DELETE_DUPLICATES).rowcount:
+                    self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+                self.conn.execute('CREATE UNIQUE INDEX sets_key ON sets (date, workout, exercise, set_num)')
+        
+        # Первый запуск: переносим накопленные в CSV данные
+        if self.version() == 0:
+            existing = read_local_data()
+            if not existing.empty:
+                self.append(existing)
+    
+    def query(self, sql, params=()):
+        with self.lock:
+            return pd.read_sql_query(sql, self.conn, params=params, parse_dates={'Дата': DATE_FORMAT})
+    
+    def query_sets(self, sql, params=()):
+        """Запрос подходов (SELECT + условия) в типах SCHEMA"""
+        return apply_schema(self.query(self.SELECT + sql, params))
+    
+    def version(self):
+        with self.lock:
+            return self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    
+    def read(self, start=None, end=None):
+        """Подходы за период [start, end] (по умолчанию - вся история)"""
+        return self.query_sets(' WHERE date BETWEEN ? AND ? ORDER BY id',
+                               (start or '0000-00-00', end or '9999-99-99'))
+    
+    def write_rows(self, df):
+        rows = df[COLUMNS].assign(Дата=pd.to_datetime(df['Дата']).dt.strftime(DATE_FORMAT)).itertuples(index=False, name=None)
+        self.conn.executemany(
+            """
+            INSERT INTO sets (date, workout, exercise, set_num, reps, weight) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (date, workout, exercise, set_num) DO UPDATE SET reps = excluded.reps, weight = excluded.weight
+            """,
+            ((date, workout, exercise, int(set_num), int(reps), float(weight))
+             for date, workout, exercise, set_num, reps, weight in rows)
+        )
+        self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+    
+    def stored_values(self, df):
+        """Сохраненные (повторения, вес) подходов с ключами из df: {ключ: значения}.
+        
+        Ключи ищутся по уникальному индексу sets_key пачками по KEY_BATCH,
+        остальная история не читается.
+        """
+        keys = list(zip(df['Дата'].dt.strftime(DATE_FORMAT).tolist(), df['Тренировка'].astype(str).tolist(),
+                        df['Упражнение'].astype(str).tolist(), df['Подход'].astype(int).tolist()))
+        values = {}
+        with self.lock:
+            for start in range(0, len(keys), self.KEY_BATCH):
+                batch = keys[start:start + self.KEY_BATCH]
+                rows = self.conn.execute(
+                    f"""
+                    SELECT date, workout, exercise, set_num, reps, weight FROM sets
+                    WHERE (date, workout, exercise, set_num) IN (VALUES {', '.join(['(?, ?, ?, ?)'] * len(batch))})
+                    """,
+                    [value for key in batch for value in key]
+                )
+                for date, workout, exercise, set_num, reps, weight in rows:
+                    values[(pd.Timestamp(date), workout, exercise, set_num)] = (reps, weight)
+        return values
+    
+    def append(self, df):
+        """Добавить или обновить подходы одной транзакцией"""
+        with self.lock, self.conn:
+            self.write_rows(df)
+    
+    def replace(self, df):
+        """Заменить все данные одной транзакцией"""
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM sets')
+            self.write_rows(df)
+    
+    def iter_chunks(self, chunk_rows):
+        """Все подходы частями по chunk_rows строк в порядке записи.
+        
+        Части выбираются по диапазону id, между ними база не блокируется.
+        """
+        last_id = 0
+        while True:
+            with self.lock:
+                chunk_end = self.conn.execute(
+                    'SELECT MAX(id) FROM (SELECT id FROM sets WHERE id > ? ORDER BY id LIMIT ?)',
+                    (last_id, chunk_rows)
+                ).fetchone()[0]
+            if chunk_end is None:
+                return
+            yield self.query_sets(' WHERE id > ? AND id <= ? ORDER BY id', (last_id, chunk_end))
+            last_id = chunk_end
+    
+    def last_sessions(self):
+        """Подходы последней тренировки каждого упражнения"""
+        return self.query_sets("""
+            WHERE (workout, exercise, date) IN (
+                SELECT workout, exercise, MAX(date) FROM sets GROUP BY workout, exercise
+            )
+            ORDER BY date, set_num
+        """)
+    
+    def progress_per_day(self):
+        """Сводка по упражнениям и дням для build_progress_index (индекс exercise, date)"""
+        return self.query("""
+            SELECT exercise AS "Упражнение", date AS "Дата",
+                   MAX(weight) AS "Вес", MAX(reps) AS "Повторения",
+                   SUM(reps * weight) AS "Объем", COUNT(*) AS "Подходы",
+                   MAX(weight * (1 + reps / 30.0)) AS "1ПМ"
+            FROM sets
+            GROUP BY exercise, date
+        """).set_index(['Упражнение', 'Дата']).sort_index()
+    
+    def sessions_per_day(self, start=None, end=None):
+        """Тренировки по дням: количество подходов и тоннаж (индекс date, workout)"""
+        return self.query("""
+            SELECT date AS "Дата", workout AS "Тренировка",
+                   COUNT(*) AS "Подходы", SUM(reps * weight) AS "Тоннаж"
+            FROM sets
+            WHERE date BETWEEN ? AND ?
+            GROUP BY date, workout
+            ORDER BY date
+        """, (start or '0000-00-00', end or '9999-99-99'))
+
+@shared_resource
+def sqlite_storage():
+    return SqliteStorage(SQLITE_FILE)
+
+class ParquetStorage:
+    """Снимок подходов в Parquet, по файлу на месяц.
+    
+    Чтение за период открывает только файлы нужных месяцев, а условие на
+    дату и список колонок передаются pyarrow, поэтому лишние группы строк
+    и колонки не читаются. Запись переписывает только месяцы новых
+    подходов, каждый файл подменяется целиком через временный.
+    """
+    
+    def __init__(self, path):
+        try:
+            import pyarrow.parquet
+        except ImportError as e:
+            raise StorageError("Для STORAGE_BACKEND=parquet нужен пакет pyarrow") from e
+        self.parquet = pyarrow.parquet
+        self.path = path
+        self.lock = threading.Lock()
+        
+        # Первый запуск: переносим накопленные в CSV данные
+        if not os.path.isdir(path):
+            os.makedirs(path)
+            existing = read_local_data()
+            if not existing.empty:
+                self.append(existing)
+    
+    def month_files(self):
+        """{месяц 'ГГГГ-ММ': путь к файлу}"""
+        return {
+            name[:-len('.parquet')]: os.path.join(self.path, name)
+            for name in os.listdir(self.path) if name.endswith('.parquet')
+        }
+    
+    def version(self):
+        return tuple(sorted((month, file_version(path)) for month, path in self.month_files().items()))
+    
+    def read(self, start=None, end=None, columns=None):
+        """Подходы за период [start, end] (по умолчанию - вся история).
+        
+        columns - нужные колонки, по умолчанию все.
+        """
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        filters = []
+        if start is not None:
+            filters.append(('Дата', '>=', start))
+        if end is not None:
+            filters.append(('Дата', '<=', end))
+        
+        # Месяцы вне периода не открываются вовсе
+        paths = [
+            path for month, path in sorted(self.month_files().items())
+            if (start is None or month >= start.strftime('%Y-%m'))
+            and (end is None or month <= end.strftime('%Y-%m'))
+        ]
+        if not paths:
+            return empty_data()[columns or COLUMNS]
+        # Все месяцы читаются одним набором данных - это в разы быстрее, чем по файлу
+        dataset = self.parquet.ParquetDataset(paths, filters=filters or None)
+        return apply_schema(dataset.read(columns=columns).to_pandas())
+    
+    def write_month(self, month, df):
+        path = os.path.join(self.path, f'{month}.parquet')
+        df.to_parquet(f'{path}.tmp', index=False)
+        os.replace(f'{path}.tmp', path)
+    
+    def append(self, df):
+        """Добавить или обновить подходы, переписав только их месяцы"""
+        with self.lock:
+            files = self.month_files()
+            for month, rows in split_into_shards(df).items():
+                if month in files:
+                    rows = upsert_rows(apply_schema(self.parquet.read_table(files[month]).to_pandas()), rows)
+                self.write_month(month, apply_schema(rows))
+    
+    def replace(self, df):
+        """Заменить все данные: записать новые месяцы и удалить лишние"""
+        with self.lock:
+            shards = split_into_shards(apply_schema(df))
+            for month, rows in shards.items():
+                self.write_month(month, rows)
+            for month, path in self.month_files().items():
+                if month not in shards:
+                    os.remove(path)
+
+@shared_resource
+def parquet_storage():
+    return ParquetStorage(PARQUET_DIR)
+
+def table_storage():
+    """Хранилище для STORAGE_BACKEND=sqlite или parquet"""
+    if storage_backend() == 'sqlite':
+        return sqlite_storage()
+    return parquet_storage()
+
+def convert_csv_to_parquet(csv_path=DATA_FILE, parquet_dir=PARQUET_DIR):
+    """Однократно перенести CSV в помесячный снимок Parquet. Возвращает число строк"""
+    data = read_csv(csv_path)
+    os.makedirs(parquet_dir, exist_ok=True)
+    ParquetStorage(parquet_dir).replace(data)
+    return len(data)
+
+def read_sets(start=None, end=None, columns=None):
+    """Подходы за период [start, end] только с колонками columns.
+    
+    Parquet читает только файлы нужных месяцев и нужные колонки, SQLite -
+    строки периода по индексу. CSV и Gist хранят историю целиком, для них
+    данные фильтруются в памяти.
+    """
+    backend = storage_backend()
+    if backend == 'parquet':
+        return parquet_storage().read(start, end, columns)
+    if backend == 'sqlite':
+        data = sqlite_storage().read(
+            None if start is None else pd.Timestamp(start).strftime(DATE_FORMAT),
+            None if end is None else pd.Timestamp(end).strftime(DATE_FORMAT),
+        )
+    else:
+        data = load_data()
+        if start is not None:
+            data = data[data['Дата'] >= pd.Timestamp(start)]
+        if end is not None:
+            data = data[data['Дата'] <= pd.Timestamp(end)]
+    return data[columns or COLUMNS]
+
+def read_exercise_sets(exercise):
+    """Все подходы упражнения по дням.
+    
+    SQLite выбирает их по индексу (exercise, date), остальные хранилища
+    фильтруют загруженные данные.
+    """
+    if storage_backend() == 'sqlite':
+        return sqlite_storage().query_sets(' INDEXED BY sets_exercise_date WHERE exercise = ? ORDER BY date, id',
+                                           (exercise,))
+    data = load_data()
+    return data[data['Упражнение'] == exercise]
+
+def add_workout_sets(sets):
+    """Сохранить пачку подходов одной транзакцией.
+    
+    sets - список кортежей (дата, тренировка, упражнение, подход, повторения, вес).
+    Данные загружаются один раз, записываются на диск одной операцией и
+    синхронизируются с Gist не более одного раза, сколько бы подходов ни было.
+    
+    Сохранение - upsert по KEY_COLUMNS: подход, который уже есть в данных,
+    обновляется, а повторное сохранение тех же значений ничего не пишет.
+    Чтение, дополнение и запись идут под write_lock, поэтому одновременные
+    сохранения из разных сессий не затирают строки друг друга.
+    
+    Возвращает записанные подходы - новые и измененные, в типах SCHEMA.
+    Вся история не собирается: кому она нужна, вызывает load_data.
+    """
+    if not sets:
+        return empty_data()
+    return add_workout_rows(pd.DataFrame(sets, columns=COLUMNS))
+
+def add_workout_rows(rows):
+    """То же, что add_workout_sets, для подходов в DataFrame с колонками COLUMNS"""
+    with write_lock(), PROFILER.span('add_workout_sets') as counters:
+        counters['rows'] = len(rows)
+        if rows.empty:
+            return empty_data()
+        # Ошибка хранилища должна дойти до страницы как StorageError
+        old_version = check_storage()
+        
+        # Новые и измененные подходы находятся по хеш-индексу ключей, а в
+        # SQLite - запросом только по ключам сохраняемых подходов
+        new_rows = deduplicate(apply_schema(rows[COLUMNS]))
+        if storage_backend() == 'sqlite':
+            inserted, updated, _ = classify_sets(new_rows, sqlite_storage().stored_values(new_rows))
+        else:
+            inserted, updated, _ = get_data_index('set_keys').classify(new_rows)
+        counters.update(inserted=int(inserted.sum()), updated=int(updated.sum()))
+        new_rows = new_rows[inserted | updated]
+        if new_rows.empty:
+            # Те же подходы уже сохранены
+            return new_rows
+        
+        if storage_backend() in ('sqlite', 'parquet'):
+            # В SQLite строки вставляются или обновляются по уникальному ключу,
+            # в Parquet переписывается только их месяц, история не перечитывается
+            table_storage().append(new_rows)
+        elif updated.any():
+            # Измененные подходы переписываются на своих местах, поэтому
+            # дописать их в журнал нельзя - файл перезаписывается целиком
+            save_data(upsert_rows(load_data(), new_rows))
+        elif journal_enabled() and get_gist_credentials() is None:
+            # Локально только дописываем новые строки, история не собирается
+            append_to_journal(new_rows)
+        else:
+            # Синхронизация с Gist отправляет локальную копию, поэтому
+            # при настроенном Gist она всегда должна быть полной
+            save_data(apply_schema(pd.concat([load_data(), new_rows], ignore_index=True)))
+        
+        if updated.any():
+            # Сводки дополняются только новыми строками, после изменения
+            # они перестроятся для новой версии данных. В индексе ключей
+            # новые значения просто заменяют старые
+            update_data_indexes(old_version, new_rows, names=('set_keys',))
+        else:
+            update_data_indexes(old_version, new_rows)
+        return new_rows
+
+def deduplicate_data():
+    """Удалить из хранилища повторы подходов, оставив последнюю запись каждого ключа.
+    
+    Нужно один раз для данных, сохраненных до upsert. Возвращает число удаленных строк.
+    """
+    with write_lock():
+        data = load_data()
+        deduplicated = deduplicate(data)
+        removed = len(data) - len(deduplicated)
+        if removed:
+            save_data(deduplicated)
+        return removed
+
+def add_workout_data(date, workout, exercise, set_num, reps, weight):
+    return add_workout_sets([(date, workout, exercise, set_num, reps, weight)])
+
+# Сколько строк читается и записывается за раз при импорте и экспорте
+IMPORT_CHUNK_ROWS = 10_000
+EXPORT_CHUNK_ROWS = 10_000
+# Сколько ошибочных строк импорта перечислять в отчете
+IMPORT_MAX_ERRORS = 20
+# Форматы экспорта и их MIME-типы
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+def validate_import_chunk(chunk):
+    """Проверить часть импортируемого CSV (все колонки - строки).
+    
+    Тренировка и упражнение должны быть парой из WORKOUTS, дата - в формате
+    DATE_FORMAT, номер подхода, повторения и вес - неотрицательными числами,
+    которые помещаются в типы SCHEMA. Возвращает (подходы в типах SCHEMA,
+    ошибки вида 'строка N: причина').
+    """
+    dates = pd.to_datetime(chunk['Дата'].str.strip(), format=DATE_FORMAT, errors='coerce')
+    workouts = chunk['Тренировка'].str.strip()
+    exercises = chunk['Упражнение'].str.strip()
+    set_nums, reps, weights = (pd.to_numeric(chunk[column], errors='coerce') for column in ('Подход', 'Повторения', 'Вес'))
+    known = pd.MultiIndex.from_tuples([(workout, exercise) for workout, names in WORKOUTS.items() for exercise in names])
+    
+    # Первая подходящая причина отказа для каждой строки
+    checks = [
+        (dates.isna(), "дата не в формате ГГГГ-ММ-ДД"),
+        (pd.Series(~pd.MultiIndex.from_arrays([workouts, exercises]).isin(known), index=chunk.index),
+         "упражнения нет в этой тренировке"),
+        (~set_nums.between(1, 127) | (set_nums % 1 != 0), "номер подхода - не целое число от 1 до 127"),
+        (~reps.between(0, 32767) | (reps % 1 != 0), "повторения - не целое неотрицательное число"),
+        (~weights.between(0, 10_000), "вес - не число от 0 до 10000"),
+    ]
+    reasons = pd.Series(None, index=chunk.index, dtype=object)
+    for failed, reason in reversed(checks):
+        reasons[failed.to_numpy()] = reason
+    invalid = reasons.notna()
+    
+    # Строка 1 - заголовок, индекс частей read_csv сквозной
+    errors = [f"строка {line + 2}: {reason}" for line, reason in reasons[invalid].items()]
+    rows = pd.DataFrame({
+        'Дата': dates, 'Тренировка': workouts, 'Упражнение': exercises,
+        'Подход': set_nums, 'Повторения': reps, 'Вес': weights,
+    })[~invalid]
+    return apply_schema(rows), errors
+
+def import_sets(source, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Импортировать подходы из CSV по частям в текущее хранилище.
+    
+    Файл читается по chunk_rows строк, каждая часть проверяется
+    validate_import_chunk и сохраняется через add_workout_rows (upsert по
+    KEY_COLUMNS), поэтому повторный импорт того же файла ничего не меняет.
+    SQLite, Parquet и журнал сохраняют каждую часть сразу. CSV и Gist
+    переписываются целиком при любой записи, поэтому для них сначала
+    проверяется весь файл, а подходы сохраняются одной записью.
+    Возвращает отчет {'rows', 'accepted', 'rejected', 'errors'}, в errors -
+    не больше IMPORT_MAX_ERRORS первых ошибок.
+    """
+    report = {'rows': 0, 'accepted': 0, 'rejected': 0, 'errors': []}
+    per_chunk = storage_backend() in ('sqlite', 'parquet') or (journal_enabled() and get_gist_credentials() is None)
+    pending = []
+    with PROFILER.span('import_sets') as counters:
+        with pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                missing = [column for column in COLUMNS if column not in chunk]
+                if missing:
+                    raise StorageError(f"В файле нет колонок: {', '.join(missing)}")
+                rows, errors = validate_import_chunk(chunk)
+                if not rows.empty:
+                    if per_chunk:
+                        add_workout_rows(rows)
+                    else:
+                        pending.append(rows)
+                report['rows'] += len(chunk)
+                report['accepted'] += len(rows)
+                report['rejected'] += len(errors)
+                report['errors'] += errors[:IMPORT_MAX_ERRORS - len(report['errors'])]
+        if pending:
+            add_workout_rows(apply_schema(pd.concat(pending, ignore_index=True)))
+        counters.update(rows=report['rows'], accepted=report['accepted'])
+    return report
+
+def rechunk(frames, chunk_rows):
+    """Склеить мелкие части и нарезать крупные так, чтобы в каждой было chunk_rows строк"""
+    buffer, size = [], 0
+    for frame in frames:
+        buffer.append(frame)
+        size += len(frame)
+        if size < chunk_rows:
+            continue
+        merged = apply_schema(pd.concat(buffer, ignore_index=True))
+        for start in range(0, len(merged) - chunk_rows + 1, chunk_rows):
+            yield merged.iloc[start:start + chunk_rows]
+        rest = merged.iloc[len(merged) // chunk_rows * chunk_rows:]
+        buffer, size = [rest], len(rest)
+    if size:
+        yield apply_schema(pd.concat(buffer, ignore_index=True))
+
+def iter_set_chunks(chunk_rows=EXPORT_CHUNK_ROWS):
+    """Все подходы частями по chunk_rows строк в типах SCHEMA.
+    
+    SQLite читается постранично по id, Parquet - по месяцу, локальный CSV -
+    частями read_csv, так что история целиком в память не собирается.
+    Данные Gist уже лежат в кэше load_data и просто нарезаются.
+    """
+    version = get_data_version()
+    if version[0] == 'sqlite':
+        yield from sqlite_storage().iter_chunks(chunk_rows)
+        return
+    if version[0] == 'parquet':
+        storage = parquet_storage()
+        months = [pd.Timestamp(f'{month}-01') for month in sorted(storage.month_files())]
+        frames = (storage.read(month, month + pd.offsets.MonthEnd(0)) for month in months)
+    elif version[0] == 'local':
+        # Журнал невелик и читается целиком, без недописанной строки
+        frames = (chunk for path in local_data_files() if os.path.exists(path)
+                  for chunk in (read_csv_chunks(path, chunk_rows) if path == DATA_FILE else [read_journal(path)]))
+    else:
+        frames = [load_data()]
+    yield from rechunk(frames, chunk_rows)
+
+class ExportSink:
+    """Файловый объект для ParquetWriter, из которого записанное забирается частями.
+    
+    tell() считает все записанные байты, как у обычного файла, иначе
+    смещения в метаданных Parquet будут неверными.
+    """
+    
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        return self.position
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+def iter_parquet_export(chunks):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise StorageError("Для экспорта в Parquet нужен пакет pyarrow") from e
+    sink = ExportSink()
+    writer = None
+    for chunk in chunks:
+        table = pyarrow.Table.from_pandas(chunk, preserve_index=False)
+        if writer is None:
+            writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), table.schema)
+        # Каждая часть - отдельная группа строк с той же схемой, что у первой
+        writer.write_table(table.cast(writer.schema))
+        yield sink.drain()
+    if writer is None:
+        table = pyarrow.Table.from_pandas(empty_data(), preserve_index=False)
+        writer = pyarrow.parquet.ParquetWriter(pyarrow.PythonFile(sink, mode='w'), table.schema)
+    writer.close()
+    yield sink.drain()
+
+def iter_export(fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Выгрузка всех подходов в формате fmt из EXPORT_FORMATS частями байтов.
+    
+    В памяти одновременно держится одна часть из chunk_rows строк, поэтому
+    выгрузку можно писать в файл или отдавать по сети любого размера.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    chunks = iter_set_chunks(chunk_rows)
+    if fmt == 'parquet':
+        yield from iter_parquet_export(chunks)
+        return
+    
+    header = True
+    for chunk in chunks:
+        if fmt == 'csv':
+            text = chunk.to_csv(index=False, header=header, date_format=DATE_FORMAT)
+        else:
+            chunk = chunk.assign(Дата=chunk['Дата'].dt.strftime(DATE_FORMAT))
+            text = chunk.to_json(orient='records', lines=True, force_ascii=False)
+            if not text.endswith('\n'):
+                text += '\n'
+        header = False
+        yield text.encode('utf-8')
+    if header and fmt == 'csv':
+        # Данных нет - только заголовок
+        yield (','.join(COLUMNS) + '\n').encode('utf-8')
+
+def export_sets(path, fmt, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Записать все подходы в файл path. Возвращает размер файла в байтах"""
+    with PROFILER.span('export_sets') as counters, open(f'{path}.tmp', 'wb') as f:
+        for data in iter_export(fmt, chunk_rows):
+            f.write(data)
+        counters['bytes'] = f.tell()
+    os.replace(f'{path}.tmp', path)
+    return os.path.getsize(path)
+
+def get_workout_dates(data):
+    """Получить даты тренировок со списком типов тренировок в каждый день"""
+    if data.empty:
+        return {}
+    
+    daily = build_daily_index(workout_sessions(data))
+    return dict(zip(daily.index, daily['Тренировки']))
+
+def get_previous_workout_data(data, workout, exercise):
+    """Получить данные предыдущей тренировки для указанного упражнения"""
+    if data.empty:
+        return None
+    
+    # Фильтруем данные по тренировке и упражнению
+    filtered_data = data[(data['Тренировка'] == workout) & (data['Упражнение'] == exercise)]
+    
+    if filtered_data.empty:
+        return None
+    
+    # Находим последнюю дату тренировки для этого упражнения
+    last_date = filtered_data['Дата'].max()
+    
+    # Получаем данные этой тренировки
+    last_workout_data = filtered_data[filtered_data['Дата'] == last_date]
+    
+    return last_workout_data
+
+def recommend_next_workout(data):
+    """Рекомендовать следующую тренировку на основе истории"""
+    if data.empty:
+        return "Тренировка A"  # Если нет данных, начинаем с тренировки A
+    
+    # Получаем уникальные даты тренировок
+    workout_dates = get_workout_dates(data)
+    
+    if not workout_dates:
+        return "Тренировка A"
+    
+    # Получаем последнюю дату тренировки и ее тип (при нескольких
+    # тренировках в день - последнюю по названию)
+    last_date = max(workout_dates.keys())
+    last_workout = max(workout_dates[last_date])
+    
+    return next_workout_in_cycle(last_workout)
+
+def next_workout_in_cycle(last_workout):
+    # Определяем следующую тренировку по циклу
+    workout_order = ["Тренировка A", "Тренировка B", "Тренировка C", "Тренировка D"]
+    current_index = workout_order.index(last_workout)
+    next_index = (current_index + 1) % len(workout_order)
+    
+    return workout_order[next_index]
+
+class LastSessionIndex:
+    """Последняя тренировка каждого упражнения и последняя тренировка вообще.
+    
+    Строится одним проходом по данным и дополняется новыми подходами при
+    сохранении, поэтому поиск на странице записи - обращение к словарю
+    вместо фильтрации всей истории.
+    """
+    
+    def __init__(self, data):
+        # (тренировка, упражнение) -> (дата, подходы этой даты)
+        self.sessions = {}
+        self.last_date = None
+        self.last_workout = None
+        self.update(data)
+    
+    def update(self, rows):
+        if rows.empty:
+            return
+        dates = rows['Дата']
+        group_keys = [rows['Тренировка'], rows['Упражнение']]
+        latest = rows[dates == dates.groupby(group_keys, observed=True).transform('max')]
+        
+        for key, group in latest.groupby(['Тренировка', 'Упражнение'], sort=False, observed=True):
+            date = group['Дата'].iloc[0]
+            current = self.sessions.get(key)
+            if current is None or date > current[0]:
+                self.sessions[key] = (date, group)
+            elif date == current[0]:
+                self.sessions[key] = (date, pd.concat([current[1], group], ignore_index=True))
+        
+        # Если в последний день было несколько тренировок, как и раньше
+        # берем последнюю по названию
+        last_date = dates.max()
+        last_workout = rows.loc[dates == last_date, 'Тренировка'].max()
+        if self.last_date is None or last_date > self.last_date:
+            self.last_date, self.last_workout = last_date, last_workout
+        elif last_date == self.last_date:
+            self.last_workout = max(self.last_workout, last_workout)
+    
+    def previous(self, workout, exercise):
+        """То же, что get_previous_workout_data, но без просмотра данных"""
+        session = self.sessions.get((workout, exercise))
+        return None if session is None else session[1]
+    
+    def recommend_next_workout(self):
+        if self.last_workout is None:
+            return "Тренировка A"
+        return next_workout_in_cycle(self.last_workout)
+
+def update_last_session_index(index, new_rows):
+    index.update(new_rows)
+    return index
+
+class SetKeyIndex:
+    """Хеш-индекс сохраненных подходов: ключ KEY_COLUMNS -> (повторения, вес).
+    
+    При сохранении каждый подход проверяется обращением к словарю: новый
+    он, изменился или уже записан в точности таким же.
+    """
+    
+    def __init__(self, data):
+        self.values = {}
+        self.update(data)
+    
+    def update(self, rows):
+        keys = zip(rows['Дата'], rows['Тренировка'], rows['Упражнение'], rows['Подход'])
+        self.values.update(zip(keys, zip(rows['Повторения'], rows['Вес'])))
+    
+    def classify(self, rows):
+        return classify_sets(rows, self.values)
+
+def classify_sets(rows, stored_values):
+    """Разделить подходы rows на новые, измененные и уже сохраненные (маски строк).
+    
+    stored_values - сохраненные значения {ключ: (повторения, вес)}, как в
+    SetKeyIndex или SqliteStorage.stored_values.
+    """
+    keys = zip(rows['Дата'], rows['Тренировка'], rows['Упражнение'], rows['Подход'])
+    stored = [stored_values.get(key) for key in keys]
+    values = zip(rows['Повторения'], rows['Вес'])
+    inserted = pd.Series([value is None for value in stored], index=rows.index)
+    unchanged = pd.Series([old == new for old, new in zip(stored, values)], index=rows.index)
+    return inserted, ~inserted & ~unchanged, unchanged
+
+def update_set_key_index(index, new_rows):
+    index.update(new_rows)
+    return index
+
+def workout_sessions(data):
+    """Подходы и тоннаж каждой тренировки: строка на пару (дата, тренировка)"""
+    return (data.assign(Тоннаж=data['Повторения'] * data['Вес'])
+                .groupby(['Дата', 'Тренировка'], as_index=False, observed=True)
+                .agg(Подходы=('Подход', 'size'), Тоннаж=('Тоннаж', 'sum')))
+
+def build_daily_index(sessions):
+    """Индекс по дням из workout_sessions: тренировки, число подходов и тоннаж.
+    
+    Индекс - отсортированные даты, поэтому месяц или год выбирается срезом
+    daily.loc[начало:конец] без просмотра всей истории.
+    """
+    grouped = sessions.sort_values(['Дата', 'Тренировка']).groupby('Дата', sort=True)
+    daily = grouped[['Подходы', 'Тоннаж']].sum()
+    daily['Тренировки'] = grouped['Тренировка'].agg(list)
+    return daily
+
+def update_daily_index(daily, new_rows):
+    """Добавить в индекс по дням новые подходы, пересчитав только их дни"""
+    added = build_daily_index(workout_sessions(new_rows))
+    existing = added.index.intersection(daily.index)
+    daily = daily.copy()
+    for date in existing:
+        daily.at[date, 'Подходы'] += added.at[date, 'Подходы']
+        daily.at[date, 'Тоннаж'] += added.at[date, 'Тоннаж']
+        daily.at[date, 'Тренировки'] = sorted(set(daily.at[date, 'Тренировки']) | set(added.at[date, 'Тренировки']))
+    return pd.concat([daily, added.drop(existing)]).sort_index()
+
+# Как сводятся показатели одного упражнения за день
+PROGRESS_AGGREGATES = {'Вес': 'max', 'Повторения': 'max', 'Объем': 'sum', 'Подходы': 'sum', '1ПМ': 'max'}
+
+def build_progress_index(data):
+    """Сводка по упражнениям и дням: максимальный вес и повторения, объем,
+    число подходов и расчетный 1ПМ (по формуле Эпли).
+    
+    Индекс (упражнение, дата) отсортирован, история одного упражнения
+    выбирается через progress.xs(упражнение).
+    """
+    sets = data.assign(
+        Объем=data['Повторения'] * data['Вес'],
+        Подходы=1,
+        **{'1ПМ': data['Вес'] * (1 + data['Повторения'] / 30)}
+    )
+    return sets.groupby(['Упражнение', 'Дата'], sort=True, observed=True)[list(PROGRESS_AGGREGATES)].agg(PROGRESS_AGGREGATES)
+
+def update_progress_index(progress, new_rows):
+    """Добавить в сводку новые подходы, пересчитав только их дни"""
+    added = build_progress_index(new_rows)
+    touched = added.index.intersection(progress.index)
+    merged = pd.concat([progress.loc[touched], added.loc[touched]]).groupby(level=[0, 1], observed=True).agg(PROGRESS_AGGREGATES)
+    return pd.concat([progress.drop(touched), added.drop(touched), merged]).sort_index()
+
+# Сколько точек графика прогресса отдавать в браузер без укрупнения
+CHART_MAX_POINTS = 200
+# Периоды укрупнения по порядку: (частота pandas, название для подписи, дней)
+CHART_BUCKETS = [('W', 'неделям', 7), ('MS', 'месяцам', 30), ('QS', 'кварталам', 91)]
+
+def downsample_progress(progress, max_points=CHART_MAX_POINTS):
+    """Укрупнить сводку одного упражнения (индекс - даты) для графика.
+    
+    Пока точек не больше max_points, сводка возвращается как есть. Иначе
+    дни сводятся в недели, месяцы или кварталы - первый период, при котором
+    точек хватает, - по тем же правилам, что и подходы в день (PROGRESS_AGGREGATES).
+    Возвращает (сводка, название периода или None).
+    """
+    if len(progress) <= max_points:
+        return progress, None
+    for freq, label, _ in CHART_BUCKETS:
+        buckets = progress.resample(freq).agg(PROGRESS_AGGREGATES)
+        # Пустые периоды (пропущенные недели) на графике не нужны
+        buckets = buckets[buckets['Подходы'] > 0]
+        if len(buckets) <= max_points:
+            break
+    return buckets, label
+
+# Индексы по данным: имя -> (построить по DataFrame, построить по SQLite,
+# дополнить новыми подходами)
+DATA_INDEXES = {
+    'last_sessions': (
+        LastSessionIndex,
+        # Последние тренировки выбираются запросом, вся история не читается
+        lambda storage: LastSessionIndex(storage.last_sessions()),
+        update_last_session_index,
+    ),
+    'daily': (
+        lambda data: build_daily_index(workout_sessions(data)),
+        lambda storage: build_daily_index(storage.sessions_per_day()),
+        update_daily_index,
+    ),
+    'progress': (
+        build_progress_index,
+        lambda storage: storage.progress_per_day(),
+        update_progress_index,
+    ),
+    'set_keys': (
+        SetKeyIndex,
+        # При сохранении в SQLite ключи проверяет stored_values, индекс
+        # строится, только если его запросят явно
+        lambda storage: SetKeyIndex(storage.read()),
+        update_set_key_index,
+    ),
+}
+
+@shared_resource
+def data_indexes():
+    """Общие для всех сессий индексы: имя -> (версия данных, индекс)"""
+    return {'lock': threading.Lock(), 'entries': {}}
+
+def get_data_index(name):
+    """Индекс из DATA_INDEXES для текущей версии данных"""
+    from_frame, from_sqlite, _ = DATA_INDEXES[name]
+    try:
+        version = get_data_version()
+    except Exception:
+        # Ошибку загрузки показывает check_storage
+        return from_frame(empty_data())
+    
+    indexes = data_indexes()
+    with indexes['lock']:
+        entry = indexes['entries'].get(name)
+        if entry is None or entry[0] != version:
+            with PROFILER.span(f'index {name}') as counters:
+                if version[0] == 'sqlite':
+                    index = from_sqlite(sqlite_storage())
+                else:
+                    source = read_data(version)
+                    counters['rows'] = len(source)
+                    index = from_frame(source)
+            entry = indexes['entries'][name] = (version, index)
+        return entry[1]
+
+def get_last_session_index():
+    """Индекс последних тренировок для текущей версии данных"""
+    return get_data_index('last_sessions')
+
+def get_daily_index():
+    """Индекс по дням для текущей версии данных"""
+    return get_data_index('daily')
+
+def get_progress_index():
+    """Сводка по упражнениям и дням для текущей версии данных"""
+    return get_data_index('progress')
+
+# Сколько последних тренировок упражнения сравнивается в тренде сводки
+TREND_SESSIONS = 5
+# Сколько точек на каждом маленьком графике сводки по упражнениям
+DASHBOARD_POINTS = 60
+
+def build_exercise_summary(progress):
+    """Показатели всех упражнений одним проходом по сводке по дням.
+    
+    Строка на упражнение: максимальный вес и повторения, число тренировок,
+    дата последней, прогресс по весу от первой тренировки к последней,
+    тренд - изменение веса за последние TREND_SESSIONS тренировок - и
+    последний расчетный 1ПМ.
+    """
+    days = progress.reset_index()
+    grouped = days.groupby('Упражнение', observed=True, sort=True)
+    summary = grouped.agg(**{
+        'Макс. вес': ('Вес', 'max'),
+        'Макс. повторения': ('Повторения', 'max'),
+        'Тренировок': ('Дата', 'size'),
+        'Последняя': ('Дата', 'max'),
+        'Первый вес': ('Вес', 'first'),
+        'Последний вес': ('Вес', 'last'),
+        '1ПМ': ('1ПМ', 'last'),
+    })
+    
+    first_weight = summary.pop('Первый вес')
+    summary['Прогресс, %'] = ((summary['Последний вес'] - first_weight) / first_weight * 100).where(first_weight > 0, 0)
+    
+    # Вес каждой тренировки против веса TREND_SESSIONS тренировок назад;
+    # тренд упражнения - это сравнение для его последней тренировки
+    before = grouped['Вес'].shift(TREND_SESSIONS)
+    trend = ((days['Вес'] / before - 1) * 100).where(before > 0)
+    last_rows = grouped.tail(1).index
+    summary['Тренд, %'] = pd.Series(trend[last_rows].to_numpy(), index=days.loc[last_rows, 'Упражнение'])
+    return summary
+
+def build_dashboard_series(progress, max_points=DASHBOARD_POINTS):
+    """Максимальный вес всех упражнений для маленьких графиков сводки.
+    
+    Период общий для всех графиков: день или первый из CHART_BUCKETS, при
+    котором вся история укладывается в max_points точек. Возвращает
+    (данные, название периода или None).
+    """
+    days = progress.reset_index()[['Упражнение', 'Дата', 'Вес']]
+    if days.empty:
+        return days, None
+    span = (days['Дата'].max() - days['Дата'].min()).days
+    if span <= max_points:
+        return days, None
+    for freq, label, bucket_days in CHART_BUCKETS:
+        if span / bucket_days <= max_points:
+            break
+    series = days.groupby(['Упражнение', pd.Grouper(key='Дата', freq=freq)], observed=True)['Вес'].max()
+    return series.dropna().reset_index(), label
+
+@functools.lru_cache(maxsize=4)
+def read_exercise_dashboard(version):
+    """Сводка по упражнениям для версии данных: (показатели, графики, период)"""
+    progress = get_progress_index()
+    return (build_exercise_summary(progress), *build_dashboard_series(progress))
+
+def get_exercise_dashboard():
+    """Сводка по всем упражнениям для текущей версии данных"""
+    try:
+        version = get_data_version()
+    except Exception:
+        # Ошибку загрузки показывает check_storage
+        progress = build_progress_index(empty_data())
+        return (build_exercise_summary(progress), *build_dashboard_series(progress))
+    return read_exercise_dashboard(version)
+
+# Сколько построенных графиков и фрагментов страниц держать в памяти
+RENDER_CACHE_SIZE = 64
+
+class RenderCache:
+    """Ограниченный LRU-кэш построенных графиков и HTML страниц.
+    
+    Ключ - (версия данных, вид, параметры вида), поэтому при новых данных
+    старые записи просто перестают находиться, а при сохранении подходов
+    записи прежней версии удаляются сразу.
+    """
+    
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+    
+    def get(self, version, view, params, build):
+        key = (version, view, params)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        
+        # Строим без блокировки: две сессии в худшем случае построят одно и то же
+        with PROFILER.span(f'render {view}'):
+            value = build()
+        with self.lock:
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+    
+    def evict_version(self, version):
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == version]:
+                del self.entries[key]
+
+@shared_resource
+def render_cache():
+    return RenderCache(RENDER_CACHE_SIZE)
+
+def cached_render(view, params, build):
+    """Результат build() для вида view с параметрами params из кэша отрисовки.
+    
+    build вызывается, только если для текущей версии данных этого вида с
+    этими параметрами еще нет. Результат общий для всех сессий, изменять
+    его нельзя.
+    """
+    try:
+        version = get_data_version()
+    except Exception:
+        # Ошибку загрузки показывает check_storage
+        return build()
+    return render_cache().get(version, view, params, build)
+
+def update_data_indexes(old_version, new_rows, names=None):
+    """Дополнить индексы сохраненными подходами вместо полной перестройки.
+    
+    names ограничивает обновление этими индексами, остальные перестроятся.
+    """
+    # Графики и страницы прежней версии больше не понадобятся
+    render_cache().evict_version(old_version)
+    indexes = data_indexes()
+    with indexes['lock']:
+        new_version = get_data_version()
+        for name, (version, index) in list(indexes['entries'].items()):
+            # Индексы для другой версии данных все равно будут перестроены
+            if version == old_version and (names is None or name in names):
+                indexes['entries'][name] = (new_version, DATA_INDEXES[name][2](index, new_rows))
+
+def wait_for_gist_sync():
+    """Дать фоновому потоку отправить сохранения в Gist до выхода из команды"""
+    if storage_backend() != 'csv' or get_gist_credentials() is None:
+        return
+    worker = gist_sync_worker()
+    deadline = time.monotonic() + GIST_TIMEOUT * 4
+    while worker.pending_count and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if worker.pending_count:
+        print(f"Gist не обновлен ({worker.last_error}), данные отправятся при следующем запуске приложения")
+
+def main():
+    parser = argparse.ArgumentParser(description="Служебные команды хранилища тренировок")
+    commands = parser.add_subparsers(dest='command', required=True)
+    to_parquet = commands.add_parser('to-parquet', help="перенести CSV в помесячный снимок Parquet")
+    to_parquet.add_argument('--csv', default=DATA_FILE)
+    to_parquet.add_argument('-o', '--output', default=PARQUET_DIR)
+    commands.add_parser('dedup', help="удалить повторы подходов (один раз для старых данных)")
+    import_parser = commands.add_parser('import', help="импортировать подходы из CSV частями")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--chunk-rows', type=int, default=IMPORT_CHUNK_ROWS)
+    export_parser = commands.add_parser('export', help="выгрузить все подходы частями")
+    export_parser.add_argument('-f', '--format', choices=list(EXPORT_FORMATS), default='csv')
+    export_parser.add_argument('-o', '--output', required=True)
+    export_parser.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+    
+    if args.command == 'to-parquet':
+        rows = convert_csv_to_parquet(args.csv, args.output)
+        print(f"{rows} строк записано в {args.output}")
+    elif args.command == 'dedup':
+        removed = deduplicate_data()
+        print(f"Удалено повторов: {removed}")
+        if removed:
+            wait_for_gist_sync()
+    elif args.command == 'import':
+        report = import_sets(args.path, args.chunk_rows)
+        print(f"Прочитано строк: {report['rows']}, принято: {report['accepted']}, "
+              f"отклонено: {report['rejected']}")
+        for error in report['errors']:
+            print(f"  {error}")
+        if report['accepted']:
+            wait_for_gist_sync()
+    elif args.command == 'export':
+        size = export_sets(args.output, args.format, args.chunk_rows)
+        print(f"{size} байт записано в {args.output}")
+
+if __name__ == '__main__':
+    main()